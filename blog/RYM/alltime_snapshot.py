@@ -0,0 +1,147 @@
+"""
+Contadores de escuchas de todo el historial, guardados entre ejecuciones.
+
+Por usuario se guarda {(canción, artista, álbum): escuchas} y la marca
+de agua: el `date.uts` más reciente ya contado. Cada ejecución pide sólo
+los scrobbles desde la marca (`from=`) y los suma al snapshot, en vez de
+paginar el historial entero.
+
+Los scrobbles del mismo segundo que la marca se guardan aparte para no
+contarlos dos veces al volver a pedir ese segundo. Lo que se envíe con
+retraso y una fecha anterior a la marca no se cuenta, igual que en
+ScrobbleStore.
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from recent_tracks import iter_pages
+from scrobble_store import track_to_row
+
+DEFAULT_DB_PATH = os.getenv(
+    'RYM_ALLTIME_DB',
+    str(Path(__file__).resolve().parent / 'alltime_snapshot.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alltime_tracks (
+    username TEXT NOT NULL,
+    track TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (username, track, artist, album)
+);
+
+-- Marca de agua: último uts contado y las canciones contadas en ese segundo
+CREATE TABLE IF NOT EXISTS alltime_mark (
+    username TEXT PRIMARY KEY,
+    last_uts INTEGER NOT NULL,
+    last_keys TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+
+class AllTimeSnapshot:
+    def __init__(self, db_path=DEFAULT_DB_PATH, page_workers=4):
+        self.db_path = db_path
+        self.page_workers = page_workers
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def mark(self, username):
+        """(último uts contado, {(canción, artista, álbum)} de ese segundo); (None, set()) si no hay snapshot"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT last_uts, last_keys FROM alltime_mark WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None, set()
+        return row[0], {tuple(key) for key in json.loads(row[1])}
+
+    def merge(self, username, scrobbles):
+        """
+        Suma (uts, canción, artista, álbum) posteriores a la marca y la
+        mueve, todo en una transacción. Devuelve cuántos scrobbles se contaron.
+        """
+        last_uts, last_keys = self.mark(username)
+        counts = {}
+        new_last_uts, new_last_keys = last_uts, set(last_keys)
+        for uts, track, artist, album in scrobbles:
+            key = (track, artist, album)
+            if last_uts is not None and (uts < last_uts or (uts == last_uts and key in last_keys)):
+                continue
+            counts[key] = counts.get(key, 0) + 1
+            if new_last_uts is None or uts > new_last_uts:
+                new_last_uts, new_last_keys = uts, {key}
+            elif uts == new_last_uts:
+                new_last_keys.add(key)
+
+        if new_last_uts is None:
+            return 0
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO alltime_tracks (username, track, artist, album, plays) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (username, track, artist, album) DO UPDATE SET plays = plays + excluded.plays",
+                [(username, *key, plays) for key, plays in counts.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO alltime_mark (username, last_uts, last_keys, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (username, new_last_uts, json.dumps(sorted(new_last_keys), ensure_ascii=False), int(time.time()))
+            )
+        return sum(counts.values())
+
+    def update(self, username, request):
+        """
+        Pide a Last.fm los scrobbles desde la marca y los suma.
+
+        request(params) hace user.getrecenttracks del usuario y devuelve el
+        JSON (o None si falla). Si falla alguna página no se guarda nada.
+        Lanza recent_tracks.PageFetchError.
+        """
+        last_uts, _ = self.mark(username)
+        now = int(time.time())
+
+        def fetch_page(page):
+            params = {'page': page, 'limit': 200, 'to': now}
+            if last_uts is not None:
+                params['from'] = last_uts
+            return request(params)
+
+        scrobbles = []
+        for data in iter_pages(fetch_page, workers=self.page_workers, max_retries=1):
+            for track in data['recenttracks'].get('track', []):
+                row = track_to_row(username, track)
+                if row:
+                    scrobbles.append(row[1:5])
+
+        counted = self.merge(username, scrobbles)
+        print(f"📈 {username}: {counted} scrobbles nuevos en el histórico", file=sys.stderr)
+        return counted
+
+    def tracks(self, username):
+        """{(canción, artista, álbum): escuchas} de todo el historial contado"""
+        with self._connect() as conn:
+            return {
+                (track, artist, album): plays
+                for track, artist, album, plays in conn.execute(
+                    "SELECT track, artist, album, plays FROM alltime_tracks WHERE username = ?",
+                    (username,)
+                )
+            }
@@ -1,9 +1,19 @@
-import requests
 from collections import Counter
 from dotenv import load_dotenv
+import io
 import os
 import markdown
 import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from alltime_snapshot import AllTimeSnapshot
+from lastfm_client import LastFMClient
+from recent_tracks import iter_pages, PageFetchError
+from retry_policy import LastFMError
+from scrobble_aggregator import CoincidenceIndex
+from scrobble_store import ScrobbleStore
+from stats_markdown import atomic_open, write_plays_matrix
 
 load_dotenv()
 
@@ -15,45 +25,85 @@ BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 USERNAMES = ["paqueradejere", "sdecandelario", "Nubis84", "BipolarMuzik", "bloodinmyhand", "EliasJ72", "Rocky_stereo", "Frikomid", "alberto_gu", "Music-is-Crap", "GabredMared", "Mister_Dimentio"]  # Aquí defines los usuarios que quieres consultar
 
 class LastFMStats:
-    def __init__(self, api_key, usernames):
+    def __init__(self, api_key, usernames, page_workers=4, store=None, snapshot=None):
         self.api_key = api_key
         self.usernames = usernames
-        self.base_url = "http://ws.audioscrobbler.com/2.0/"
+        # Sesión HTTP compartida (keep-alive, gzip, límite de 5 peticiones/s)
+        self.client = LastFMClient(api_key)
+        self.page_workers = page_workers
+        # Archivo local de scrobbles (None = paginar todo el historial como antes)
+        self.store = store
+        # Contadores del histórico ya guardados: sólo se suma lo posterior a la marca
+        self.snapshot = snapshot
 
     def _make_request(self, method, username, params=None):
-        default_params = {
-            'method': method,
-            'api_key': self.api_key,
+        request_params = {
             'username': username,
-            'format': 'json',
             'period': '7day'
         }
         if params:
-            default_params.update(params)
+            request_params.update(params)
         
         try:
-            response = requests.get(self.base_url, params=default_params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            # Los errores transitorios ya se reintentan dentro de call()
+            return self.client.call(method, request_params)
+        except LastFMError as e:
             print(f"Error consultando datos para {username}: {e}", file=sys.stderr)
             return None
 
+    def _get_all_tracks_store(self, username):
+        """Cuenta todo el historial desde el archivo local; sólo baja lo nuevo"""
+        self.store.sync(
+            username,
+            lambda params: self._make_request('user.getrecenttracks', username, params),
+            since=0
+        )
+        tracks = {}
+        for row in self.store.scrobbles(username):
+            key = (row['track'], row['artist'], row['album'])
+            tracks[key] = tracks.get(key, 0) + 1
+        return tracks
+
+    def _get_all_tracks_snapshot(self, username):
+        """Suma al snapshot lo escuchado desde la última ejecución y lo devuelve"""
+        request = lambda params: self._make_request('user.getrecenttracks', username, params)
+        if self.store is not None:
+            self.store.sync(username, request, since=0)
+            last_uts, _ = self.snapshot.mark(username)
+            self.snapshot.merge(username, (
+                (row['uts'], row['track'], row['artist'], row['album'])
+                for row in self.store.scrobbles(username, start=last_uts)
+            ))
+        else:
+            self.snapshot.update(username, request)
+        return self.snapshot.tracks(username)
+
     def get_all_tracks(self, username):
+        if self.snapshot is not None:
+            try:
+                return self._get_all_tracks_snapshot(username)
+            except PageFetchError:
+                print(f"Perfil privado o sin datos para {username}", file=sys.stderr)
+                return None
+
+        if self.store is not None:
+            try:
+                return self._get_all_tracks_store(username)
+            except PageFetchError:
+                print(f"Perfil privado o sin datos para {username}", file=sys.stderr)
+                return None
+
         tracks = {}
+
+        def fetch_page(page):
+            params = {
+                'page': page,
+                'limit': 200  # Máximo permitido por la API
+            }
+            return self._make_request('user.getrecenttracks', username, params)
+
         try:
-            page = 1
-            while True:
-                params = {
-                    'page': page,
-                    'limit': 200  # Máximo permitido por la API
-                }
-                data = self._make_request('user.getrecenttracks', username, params)
-                
-                if not data or 'recenttracks' not in data:
-                    print(f"Perfil privado o sin datos para {username}", file=sys.stderr)
-                    return None
-                
+            for data in iter_pages(fetch_page, workers=self.page_workers, max_retries=1):
                 for track in data['recenttracks'].get('track', []):
                     if track.get('nowplaying', False):
                         continue
@@ -64,65 +114,47 @@ class LastFMStats:
                     
                     key = (track_name, artist_name, album_name)
                     tracks[key] = tracks.get(key, 0) + 1
-                
-                total_pages = int(data['recenttracks']['@attr']['totalPages'])
-                if page >= total_pages:
-                    break
-                page += 1
             
             return tracks
+        except PageFetchError:
+            print(f"Perfil privado o sin datos para {username}", file=sys.stderr)
+            return None
         except Exception as e:
             print(f"Error procesando tracks de {username}: {e}", file=sys.stderr)
             return None
 
-    def generate_markdown(self):
-        # Filtrar usuarios con datos disponibles
-        valid_users_tracks = {}
+    def collect(self):
+        """Descarga el histórico de cada usuario y devuelve el índice de canciones"""
+        index = CoincidenceIndex()
+        valid_users = []
         for user in self.usernames:
             user_tracks = self.get_all_tracks(user)
             if user_tracks is not None:
-                valid_users_tracks[user] = user_tracks
-        
+                valid_users.append(user)
+                index.add_user(user, user_tracks, {}, {})
+
         # Actualizar lista de usuarios
-        self.usernames = list(valid_users_tracks.keys())
-        
-        md_content = "# Last.fm Weekly Statistics\n\n"
-        md_content += "## Intersecciones entre Usuarios\n\n"
-        
-        # Tracks compartidas
-        shared_tracks = []
-        all_tracks = set()
-        for user_tracks in valid_users_tracks.values():
-            all_tracks.update(user_tracks.keys())
-        
-        for track in all_tracks:
-            track_users = {}
-            for user, user_tracks in valid_users_tracks.items():
-                if track in user_tracks:
-                    track_users[user] = user_tracks[track]
-            
-            if len(track_users) > 1:
-                shared_tracks.append((track, track_users))
-        
-        if shared_tracks:
-            md_content += "### Canciones Compartidas\n"
-            md_content += "| Canción | Artista | Álbum | " + " | ".join(self.usernames) + " |\n"
-            md_content += "|---------|---------|-------|" + "|".join(["----------"] * len(self.usernames)) + "|\n"
-            
-            for (track_name, artist_name, album_name), plays_by_user in shared_tracks:
-                plays = [plays_by_user.get(user, 0) for user in self.usernames]
-                md_content += f"| {track_name} | {artist_name} | {album_name} | " + " | ".join(map(str, plays)) + " |\n"
-        
-        return md_content
+        self.usernames = valid_users
+        return index
+
+    def write_markdown(self, out, index):
+        out.write("# Last.fm Weekly Statistics\n\n")
+        out.write("## Intersecciones entre Usuarios\n\n")
+        write_plays_matrix(out, "Canciones Compartidas", index, self.usernames)
+
+    def generate_markdown(self):
+        out = io.StringIO()
+        self.write_markdown(out, self.collect())
+        return out.getvalue()
 
     def save_markdown(self, filename):
-        content = self.generate_markdown()
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(content)
+        index = self.collect()
+        with atomic_open(filename) as f:
+            self.write_markdown(f, index)
 
 # Ejemplo de uso
 def main():
-    lastfm_stats = LastFMStats(API_KEY, USERNAMES)
+    lastfm_stats = LastFMStats(API_KEY, USERNAMES, store=ScrobbleStore(), snapshot=AllTimeSnapshot())
     lastfm_stats.save_markdown('lastfm_weekly_stats.md')
 
 if __name__ == "__main__":
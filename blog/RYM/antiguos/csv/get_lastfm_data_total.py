@@ -17,16 +17,24 @@ from pathlib import Path
 import json
 import csv
 from datetime import datetime, timedelta
-import requests
 from typing import Dict, List, Tuple, Set
 import os
 from collections import defaultdict
-import statistics
 import argparse
 from itertools import combinations
 from dotenv import load_dotenv
+import numpy as np
 import sys
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import binge_detector
+from lastfm_client import LastFMClient
+from recent_tracks import PageFetchError
+from retry_policy import LastFMError
+from scrobble_aggregator import UserBitmaskIndex
+from scrobble_archive import ScrobbleArchive
+from scrobble_store import ScrobbleStore
+
 load_dotenv()
 
 # Tu API key de Last.fm
@@ -77,6 +85,8 @@ class DataManager:
         elif data_type == 'genres':
             period = kwargs.get('year', 'all_time')
             return f"genres_{kwargs['username']}_{period}.json"
+        elif data_type == 'obsessions':
+            return f"obsessions_{'+'.join(sorted(kwargs['users']))}_history.csv"
         else:
             raise ValueError(f"Tipo de datos no soportado: {data_type}")
 
@@ -103,6 +113,8 @@ class DataManager:
             base_path = base_path / 'genres'
             if 'year' in kwargs:
                 base_path = base_path / str(kwargs['year'])
+        elif data_type == 'obsessions':
+            base_path = base_path / 'obsessions'
 
         base_path.mkdir(parents=True, exist_ok=True)
         return base_path / self.get_filename(data_type, **kwargs)
@@ -180,7 +192,8 @@ class LastFMDataCollector:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.data_manager = DataManager()
-        self.base_url = "http://ws.audioscrobbler.com/2.0/"
+        # Sesión HTTP compartida (keep-alive, gzip, 5 peticiones/s)
+        self.client = LastFMClient(api_key)
         self.period_limits = {
             'weekly': 50,
             'monthly': 300,
@@ -191,8 +204,6 @@ class LastFMDataCollector:
             'monthly': 50,
             '12month': 100
         }
-        self.max_retries = 3
-        self.retry_delay = 5  # seconds
 
     # [Previous methods remain the same...]
 
@@ -216,30 +227,12 @@ class LastFMDataCollector:
                 return True
 
     def _make_request(self, method: str, params: Dict) -> Dict:
-        """Método helper para hacer peticiones a la API con reintentos"""
-        base_params = {
-            'method': method,
-            'api_key': self.api_key,
-            'format': 'json'
-        }
-        params.update(base_params)
-        
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.get(self.base_url, params=params)
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code == 500:
-                    print(f"Error 500 en intento {attempt + 1}, reintentando en {self.retry_delay} segundos...")
-                    time.sleep(self.retry_delay)
-                else:
-                    raise Exception(f"Error en la API: {response.status_code}")
-            except Exception as e:
-                if attempt == self.max_retries - 1:
-                    print(f"Error al procesar petición después de {self.max_retries} intentos: {e}")
-                    return {'error': str(e)}
-                time.sleep(self.retry_delay)
-        return {'error': 'Max retries exceeded'}
+        """Método helper para hacer peticiones a la API con reintentos según el código de error"""
+        try:
+            return self.client.call(method, params)
+        except LastFMError as e:
+            print(f"Error al procesar petición {method}: {e}")
+            return {'error': str(e)}
 
 
 
@@ -306,31 +299,65 @@ class LastFMDataCollector:
 
  
     def analyze_obsessions(self, data: Dict, period: str) -> Dict:
-        """Analiza patrones de escucha obsesivos"""
-        plays = defaultdict(lambda: {'count': 0, 'type': '', 'name': ''})
-        
+        """Analiza patrones de escucha obsesivos (más de 2 desviaciones sobre la media del top)"""
+        plays = {}
+
         for item_type in ['tracks', 'artists', 'albums']:
-            items = data.get(f'top{item_type}', {}).get(item_type, [])
-            counts = [int(item['playcount']) for item in items if 'playcount' in item]
-            
-            if counts:
-                mean = statistics.mean(counts)
-                std_dev = statistics.stdev(counts)
-                threshold = mean + (2 * std_dev)  # 2 desviaciones estándar por encima de la media
-                
-                for item in items:
-                    count = int(item.get('playcount', 0))
-                    if count > threshold:
-                        key = f"{item_type}_{item.get('name', '')}"
-                        plays[key] = {
-                            'count': count,
-                            'type': item_type,
-                            'name': item.get('name', ''),
-                            'artist': item.get('artist', {}).get('name', '') if item_type != 'artists' else None,
-                            'deviation_from_mean': (count - mean) / std_dev
-                        }
-        
-        return dict(plays)
+            response = data.get(f'top_{item_type}', {}).get(f'top{item_type}', {})
+            items = [item for item in response.get(item_type[:-1], []) if 'playcount' in item]
+            if len(items) < 2:
+                continue
+
+            counts = np.array([int(item['playcount']) for item in items])
+            mean = counts.mean()
+            std_dev = counts.std(ddof=1)
+            if std_dev == 0:
+                continue
+            deviations = (counts - mean) / std_dev
+
+            for i in np.flatnonzero(deviations > 2):  # 2 desviaciones estándar por encima de la media
+                item = items[i]
+                plays[f"{item_type}_{item.get('name', '')}"] = {
+                    'count': int(counts[i]),
+                    'type': item_type,
+                    'name': item.get('name', ''),
+                    'artist': item.get('artist', {}).get('name', '') if item_type != 'artists' else None,
+                    'deviation_from_mean': float(deviations[i])
+                }
+
+        return plays
+
+    def analyze_history_obsessions(self, users: List[str], store=None, archive=None) -> Path:
+        """
+        Obsesiones semanales y mensuales de canciones y artistas sobre todo
+        el historial de los usuarios. Guarda la tabla en CSV y devuelve la ruta.
+        """
+        store = store or ScrobbleStore()
+        archive = archive or ScrobbleArchive()
+        for username in users:
+            try:
+                store.sync(
+                    username,
+                    lambda params, username=username: self._recent_tracks_page(username, params),
+                    since=0
+                )
+            except PageFetchError as e:
+                print(f"Error al descargar el historial de {username}: {e}")
+        archive.refresh(store)
+
+        binges = [row for row in binge_detector.detect_all(archive) if row[0] in users]
+        storage_path = self.data_manager.get_storage_path('obsessions', users=users)
+        binge_detector.write_csv(storage_path, binges)
+        print(f"{len(binges)} obsesiones guardadas en: {storage_path}")
+        return storage_path
+
+    def _recent_tracks_page(self, username: str, params: Dict) -> Optional[Dict]:
+        """Página de user.getrecenttracks para ScrobbleStore.sync (None si falla)"""
+        try:
+            return self.client.call('user.getrecenttracks', {'user': username, **params})
+        except LastFMError as e:
+            print(f"Error al procesar petición user.getrecenttracks: {e}")
+            return None
 
     def _calculate_coincidences(self, users_data: Dict) -> Dict:
         """Calcula coincidencias entre usuarios"""
@@ -340,47 +367,37 @@ class LastFMDataCollector:
             'albums': {}
         }
         
-        # Obtener datos anuales para cada usuario
-        user_items = {}
+        # Índice elemento -> máscara de usuarios, en el orden de users_data
+        index = UserBitmaskIndex(users_data.keys())
         for username, data in users_data.items():
-            user_items[username] = {
-                'tracks': set(),
-                'artists': set(),
-                'albums': set()
-            }
-            
             annual_data = data.get('annual', {})
             
             # Procesar tracks
             tracks = annual_data.get('top_tracks', {}).get('toptracks', {}).get('track', [])
             for track in tracks:
                 track_id = f"{track.get('artist', {}).get('name', '')} - {track.get('name', '')}"
-                user_items[username]['tracks'].add(track_id)
+                index.add('tracks', track_id, username)
             
             # Procesar artists
             artists = annual_data.get('top_artists', {}).get('topartists', {}).get('artist', [])
             for artist in artists:
-                user_items[username]['artists'].add(artist.get('name', ''))
+                index.add('artists', artist.get('name', ''), username)
             
             # Procesar albums
             albums = annual_data.get('top_albums', {}).get('topalbums', {}).get('album', [])
             for album in albums:
                 album_id = f"{album.get('artist', {}).get('name', '')} - {album.get('name', '')}"
-                user_items[username]['albums'].add(album_id)
+                index.add('albums', album_id, username)
 
-        # Calcular coincidencias para cada tipo
+        # Coincidencias por par de usuarios: cada elemento aporta a los pares
+        # de los bits de su máscara, sin intersecar conjuntos par a par
         for item_type in ['tracks', 'artists', 'albums']:
-            # Para cada par de usuarios
+            pair_items = index.pair_items(item_type)
             for user1, user2 in combinations(users_data.keys(), 2):
-                items1 = user_items[user1][item_type]
-                items2 = user_items[user2][item_type]
-                
-                # Encontrar coincidencias
-                common_items = items1.intersection(items2)
-                
+                common_items = pair_items.get((user1, user2))
                 if common_items:
                     pair_key = f"{user1}-{user2}"
-                    coincidences[item_type][pair_key] = list(common_items)
+                    coincidences[item_type][pair_key] = common_items
 
         # Agregar metadatos
         coincidences['metadata'] = {
@@ -577,6 +594,8 @@ def main():
     parser.add_argument('--year', type=int, help='Año específico')
     parser.add_argument('--force-update', action='store_true', 
                        help='Forzar actualización de datos existentes')
+    parser.add_argument('--history-obsessions', action='store_true',
+                       help='Buscar obsesiones semanales y mensuales en todo el historial')
     
     args = parser.parse_args()
     
@@ -598,6 +617,10 @@ def main():
                 args.users,
                 year=args.year
             )
+
+        if args.history_obsessions:
+            print("Buscando obsesiones en todo el historial...")
+            collector.analyze_history_obsessions(args.users)
     except Exception as e:
         print(f"Error durante la ejecución: {e}")
         sys.exit(1)
@@ -0,0 +1,117 @@
+"""
+Caché en disco (SQLite) para respuestas de APIs que casi nunca cambian,
+como track.getInfo (duración, tags).
+
+- Cada entrada caduca a los `ttl` segundos.
+- Las respuestas "no existe" se guardan también (caché negativa) con su
+  propio TTL, para no volver a preguntar por lo mismo en cada ejecución.
+- Lleva contadores de aciertos y fallos para poder informar al final.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_DB_PATH = os.getenv(
+    'RYM_CACHE_DB',
+    str(Path(__file__).resolve().parent / 'api_cache.db')
+)
+DAY = 24 * 60 * 60
+
+# Marca para distinguir "no está en caché" de "está cacheado como inexistente"
+MISSING = object()
+
+
+class ApiCache:
+    def __init__(self, namespace, db_path=DEFAULT_DB_PATH, ttl=30 * DAY, negative_ttl=7 * DAY):
+        self.namespace = namespace
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    found INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # Una conexión por hilo y abierta: cerrar la última conexión de una
+        # base WAL fuerza un checkpoint con fsync en cada operación
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=60)
+            # En WAL, NORMAL no hace fsync en cada commit: perder la última
+            # entrada tras un corte de luz sólo cuesta repetir una petición
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        with conn:
+            yield conn
+
+    @staticmethod
+    def make_key(*parts):
+        """Clave normalizada: sin mayúsculas ni espacios sobrantes"""
+        return '\x1f'.join(str(part or '').strip().lower() for part in parts)
+
+    def get(self, key):
+        """
+        Devuelve el valor cacheado, MISSING si está cacheado como
+        inexistente, o None si no hay entrada válida.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, found, expires FROM api_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+
+        with self._lock:
+            if row is None or row[2] < time.time():
+                self.misses += 1
+                return None
+            if not row[1]:
+                self.negative_hits += 1
+                return MISSING
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self._store(key, json.dumps(value, ensure_ascii=False), True, self.ttl)
+
+    def set_missing(self, key):
+        self._store(key, None, False, self.negative_ttl)
+
+    def _store(self, key, value, found, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO api_cache (namespace, key, value, found, expires) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, value, int(found), time.time() + ttl)
+            )
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM api_cache WHERE expires < ?", (time.time(),))
+
+    def stats(self):
+        total = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.negative_hits) / total if total else 0.0,
+        }
@@ -0,0 +1,273 @@
+"""
+Benchmarks sin red de los scripts de Last.fm.
+
+Arranca fake_lastfm.FakeLastFM en un hilo, apunta los scripts a él con
+LASTFM_API_URL y mide tiempo y llamadas por método de cada escenario:
+
+- blog_rym:            semanal paginando la API
+- blog_rym_charts:     semanal con user.getweekly*chart
+- blog_rym_store:      semanal con archivo local de scrobbles (en frío y en caliente)
+- blog_rym_roster:     como blog_rym_store pero con roster.Roster (user.getinfo y
+                       perfiles privados omitidos en la segunda pasada)
+- lastfm_data:         db/lastfm_data.py semanal (caché de track.getInfo en frío y en caliente)
+- from_json_to_db:     carga en SQLite del JSON que genera lastfm_data
+
+Todo (archivo de scrobbles, caché, cubo de tokens, base de datos) va a un
+directorio temporal, así que no toca los ficheros de verdad.
+
+Ejemplos:
+    python3 bench.py
+    python3 bench.py --latency-ms 80 --error-rate 0.02 --save antes.json
+    python3 bench.py --latency-ms 80 --error-rate 0.02 --compare antes.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fake_lastfm import FakeLastFM, SyntheticLibrary
+
+RYM_DIR = Path(__file__).resolve().parent.parent
+SCHEMA_PATH = RYM_DIR / 'db' / 'schema.sql'
+
+
+def configure_environment(fake, workdir, lastfm_rate):
+    """Variables que leen los módulos compartidos al importarse"""
+    os.environ.update({
+        'LASTFM_API_URL': fake.url,
+        'LASTFM_API_KEY': 'bench',
+        'RYM_RATE_LIMITS': f'lastfm={lastfm_rate}/1',
+        'RYM_RATE_LIMIT_DB': str(workdir / 'rate_limits.db'),
+        'RYM_SCROBBLE_DB': str(workdir / 'scrobbles.db'),
+        'RYM_CACHE_DB': str(workdir / 'api_cache.db'),
+        'RYM_ROSTER_DB': str(workdir / 'roster.db'),
+        # Sin credenciales: from_json_to_db no sale a Spotify ni a Discogs
+        'SPOTIFY_CLIENT_ID': '',
+        'SPOTIFY_CLIENT_SECRET': '',
+        'DISCOGS_TOKEN': '',
+    })
+    sys.path.insert(0, str(RYM_DIR))
+    sys.path.insert(0, str(RYM_DIR / 'db'))
+
+
+def last_week():
+    """(año, semana %W) de la última semana completa"""
+    day = datetime.now() - timedelta(days=7)
+    return day.year, int(day.strftime('%W'))
+
+
+# Escenarios: cada uno recibe el contexto y hace una ejecución completa
+
+def scenario_blog_rym(ctx):
+    import blog_rym
+    stats = blog_rym.LastFMStats('bench', ctx['usernames'], workers=ctx['workers'],
+                                 page_workers=ctx['page_workers'])
+    stats.generate_markdown()
+
+
+def scenario_blog_rym_charts(ctx):
+    import blog_rym
+    stats = blog_rym.LastFMStats('bench', ctx['usernames'], workers=ctx['workers'],
+                                 page_workers=ctx['page_workers'], use_charts=True)
+    stats.generate_markdown()
+
+
+def scenario_blog_rym_store(ctx):
+    import blog_rym
+    from scrobble_store import ScrobbleStore
+    store = ScrobbleStore(os.environ['RYM_SCROBBLE_DB'], page_workers=ctx['page_workers'])
+    stats = blog_rym.LastFMStats('bench', ctx['usernames'], workers=ctx['workers'],
+                                 page_workers=ctx['page_workers'], store=store)
+    stats.generate_markdown()
+
+
+def scenario_blog_rym_roster(ctx):
+    import blog_rym
+    from roster import Roster
+    from scrobble_store import ScrobbleStore
+    # Archivo propio: el de blog_rym_store ya estaría al día
+    store = ScrobbleStore(str(ctx['workdir'] / 'scrobbles_roster.db'), page_workers=ctx['page_workers'])
+    stats = blog_rym.LastFMStats('bench', ctx['usernames'], workers=ctx['workers'],
+                                 page_workers=ctx['page_workers'], store=store, roster=Roster())
+    stats.generate_markdown()
+
+
+def scenario_lastfm_data(ctx):
+    import lastfm_data
+    from api_cache import ApiCache
+    year, week = last_week()
+    cache = ApiCache('track.getInfo', os.environ['RYM_CACHE_DB'])
+    result = lastfm_data.create_weekly_stats('bench', ctx['usernames'], year, week, cache)
+    with open(ctx['workdir'] / 'weekly.json', 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def scenario_from_json_to_db(ctx):
+    json_path = ctx['workdir'] / 'weekly.json'
+    if not json_path.exists():
+        scenario_lastfm_data(ctx)
+
+    import from_json_to_db
+    db_path = ctx['workdir'] / 'lastfm.db'
+    if db_path.exists():
+        db_path.unlink()
+    checkpoint = ctx['workdir'] / 'checkpoint.json'
+    if checkpoint.exists():
+        checkpoint.unlink()
+
+    # El loader escribe migration.log en el directorio actual
+    with _chdir(ctx['workdir']):
+        loader = from_json_to_db.LastFMDatabaseLoader(str(db_path), str(checkpoint), str(SCHEMA_PATH))
+        loader.setup_database()
+        loader.process_json_file(str(json_path))
+
+
+@contextlib.contextmanager
+def _chdir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# Escenarios con dos pasadas: la segunda mide el caso "en caliente"
+SCENARIOS = {
+    'blog_rym': [('blog_rym', scenario_blog_rym)],
+    'blog_rym_charts': [('blog_rym_charts', scenario_blog_rym_charts)],
+    'blog_rym_store': [('blog_rym_store (frío)', scenario_blog_rym_store),
+                       ('blog_rym_store (caliente)', scenario_blog_rym_store)],
+    'blog_rym_roster': [('blog_rym_roster (frío)', scenario_blog_rym_roster),
+                        ('blog_rym_roster (caliente)', scenario_blog_rym_roster)],
+    'lastfm_data': [('lastfm_data (frío)', scenario_lastfm_data),
+                    ('lastfm_data (caliente)', scenario_lastfm_data)],
+    'from_json_to_db': [('from_json_to_db', scenario_from_json_to_db)],
+}
+
+
+def run_scenario(name, func, ctx, fake, verbose):
+    from retry_policy import STATS as RETRY_STATS
+    fake.reset_stats()
+    RETRY_STATS.reset()
+    sink = io.StringIO()
+    start = time.perf_counter()
+    error = None
+    try:
+        if verbose:
+            func(ctx)
+        else:
+            with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+                func(ctx)
+    except ImportError as e:
+        error = f'dependencia no instalada: {e.name}'
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    elapsed = time.perf_counter() - start
+
+    stats = fake.stats()
+    retries = RETRY_STATS.summary()
+    return {
+        'scenario': name,
+        'seconds': round(elapsed, 3),
+        'total_calls': stats['total_calls'],
+        'calls': stats['calls'],
+        'errors': stats['errors'],
+        'retries': retries['retries'],
+        'wasted_seconds': retries['wasted_seconds'],
+        'error': error,
+    }
+
+
+def print_results(results, baseline=None):
+    previous = {r['scenario']: r for r in (baseline or [])}
+    print(f"{'Escenario':<28} {'Tiempo (s)':>11} {'Llamadas':>9}  Detalle")
+    print('-' * 90)
+    for result in results:
+        line = f"{result['scenario']:<28} {result['seconds']:>11.3f} {result['total_calls']:>9}"
+        before = previous.get(result['scenario'])
+        if before:
+            delta = result['seconds'] - before['seconds']
+            line += f"  ({delta:+.3f}s, {result['total_calls'] - before['total_calls']:+d} llamadas)"
+        if result['error']:
+            line += f"  ⚠️ {result['error']}"
+        else:
+            calls = ', '.join(f'{m}={n}' for m, n in sorted(result['calls'].items()))
+            line += f"  {calls}"
+            if result['errors']:
+                line += f"  errores: {result['errors']}"
+            if result.get('retries'):
+                line += f"  reintentos: {result['retries']} ({result['wasted_seconds']}s perdidos)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks sin red contra un Last.fm falso')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=13)
+    parser.add_argument('--scrobbles-per-day', type=int, default=60)
+    parser.add_argument('--days', type=int, default=35)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=10.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fracción de respuestas con error JSON de Last.fm')
+    parser.add_argument('--error-codes', type=int, nargs='+', default=[8])
+    parser.add_argument('--http-error-rate', type=float, default=0.0,
+                        help='Fracción de respuestas HTTP 503')
+    parser.add_argument('--private-users', type=int, default=0,
+                        help='Usuarios con perfil privado (error 17)')
+    parser.add_argument('--lastfm-rate', type=int, default=1000,
+                        help='Peticiones/s a Last.fm (5 = límite real)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--page-workers', type=int, default=4)
+    parser.add_argument('--save', help='Guardar resultados en JSON')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior para mostrar diferencias')
+    parser.add_argument('--verbose', action='store_true', help='No ocultar la salida de los scripts')
+    args = parser.parse_args()
+
+    library = SyntheticLibrary(users=args.users, scrobbles_per_day=args.scrobbles_per_day,
+                               days=args.days, seed=args.seed, private_users=args.private_users)
+    fake = FakeLastFM(library, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      error_rate=args.error_rate, error_codes=args.error_codes,
+                      http_error_rate=args.http_error_rate, seed=args.seed).start()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='rym_bench_') as tmp:
+        workdir = Path(tmp)
+        configure_environment(fake, workdir, args.lastfm_rate)
+        if not args.verbose:
+            logging.disable(logging.INFO)
+
+        ctx = {
+            'usernames': library.usernames,
+            'workers': args.workers,
+            'page_workers': args.page_workers,
+            'workdir': workdir,
+        }
+        for key in args.scenarios:
+            for name, func in SCENARIOS[key]:
+                results.append(run_scenario(name, func, ctx, fake, args.verbose))
+
+    fake.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+"""
+Servidor local que imita la API de Last.fm para medir los scripts sin red.
+
+Sirve respuestas sintéticas (y deterministas para una misma semilla) de:
+
+- user.getrecenttracks (from/to/page/limit, como la API real)
+- track.getInfo (duración y tags; una parte de las canciones da error 6)
+- user.gettopalbums (period/page/limit)
+- user.getweeklychartlist (semanas fijas de domingo a domingo, 12:00 UTC)
+- user.getweeklytrackchart / albumchart / artistchart (from/to)
+- user.getinfo (playcount)
+
+Los últimos `private_users` usuarios tienen el perfil privado: sus
+user.getrecenttracks y charts devuelven el error 17.
+
+Latencia y errores se configuran al arrancar. Cuenta las llamadas por
+método para comparar ejecuciones.
+
+Uso suelto:
+    python3 fake_lastfm.py --port 8765 --users 13 --latency-ms 80
+    LASTFM_API_URL=http://127.0.0.1:8765/2.0/ python3 ../blog_rym.py
+"""
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DAY = 24 * 60 * 60
+
+# Periodos de user.gettopalbums en segundos (None = todo)
+TOP_PERIODS = {
+    'overall': None,
+    '7day': 7 * DAY,
+    '1month': 30 * DAY,
+    '3month': 90 * DAY,
+    '6month': 180 * DAY,
+    '12month': 365 * DAY,
+}
+
+ERROR_MESSAGES = {
+    6: 'Track not found',
+    8: 'Operation failed - Most likely the backend service failed. Please try again.',
+    11: 'Service Offline - This service is temporarily offline. Try again later.',
+    16: 'There was a temporary error processing your request. Please try again',
+    17: 'Login: User required to be logged in',
+    29: 'Rate Limit Exceeded - Your IP has made too many requests in a short period',
+}
+
+
+class SyntheticLibrary:
+    """
+    Catálogo y scrobbles sintéticos.
+
+    Los usuarios eligen canciones con popularidad tipo Zipf sobre un orden
+    propio del catálogo, así que hay coincidencias entre ellos pero no
+    escuchan todos lo mismo.
+    """
+    def __init__(self, users=13, scrobbles_per_day=60, days=35, artists=300,
+                 albums_per_artist=3, tracks_per_album=10, not_found_rate=0.05,
+                 seed=1, now=None, private_users=0):
+        self.now = int(now or time.time())
+        self.not_found_rate = not_found_rate
+        self.albums_per_artist = albums_per_artist
+        self.tracks_per_album = tracks_per_album
+
+        # Catálogo: (canción, artista, álbum, índice de artista)
+        self.tracks = []
+        for a in range(artists):
+            for al in range(albums_per_artist):
+                for t in range(tracks_per_album):
+                    self.tracks.append((f'Track {a}-{al}-{t}', f'Artist {a}', f'Album {a}-{al}', a))
+
+        weights = [1.0 / (rank + 1) for rank in range(len(self.tracks))]
+        cum_weights = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            cum_weights.append(total)
+
+        # Por usuario: uts de más nuevo a más viejo y la canción de cada uno
+        self.usernames = [f'bench_user_{i:02d}' for i in range(users)]
+        self.scrobbles = {}
+        span = days * DAY
+        for username in self.usernames:
+            user_rng = random.Random(f'{seed}-{username}')
+            order = list(range(len(self.tracks)))
+            # Mezcla parcial: los favoritos cambian, la cola larga se comparte
+            head = order[:len(order) // 10]
+            user_rng.shuffle(head)
+            order[:len(head)] = head
+
+            count = scrobbles_per_day * days
+            uts = sorted((self.now - user_rng.randrange(span) for _ in range(count)), reverse=True)
+            picks = user_rng.choices(order, cum_weights=cum_weights, k=count)
+            self.scrobbles[username] = (uts, picks)
+        self.private = set(self.usernames[len(self.usernames) - private_users:]) if private_users else set()
+
+    def _range(self, username, start, end):
+        """Índices [i, j) de los scrobbles con start <= uts <= end"""
+        uts, _ = self.scrobbles[username]
+        # La lista va en orden descendente: se busca sobre los valores negados
+        negated = _Negated(uts)
+        i = bisect.bisect_left(negated, -end)
+        j = bisect.bisect_right(negated, -start)
+        return i, j
+
+    def is_not_found(self, track_index):
+        return (track_index * 2654435761) % 1000 < self.not_found_rate * 1000
+
+    def find_track(self, artist, track):
+        """Índice de la canción en el catálogo ('Track a-al-t' lleva su posición)"""
+        try:
+            a, al, t = (int(x) for x in track.rsplit(' ', 1)[1].split('-'))
+        except (ValueError, IndexError):
+            return None
+        index = (a * self.albums_per_artist + al) * self.tracks_per_album + t
+        if 0 <= index < len(self.tracks) and self.tracks[index][1] == artist:
+            return index
+        return None
+
+    def track_json(self, track_index, uts):
+        name, artist, album, _ = self.tracks[track_index]
+        return {
+            'artist': {'mbid': '', '#text': artist},
+            'streamable': '0',
+            'image': [
+                {'size': 'small', '#text': ''},
+                {'size': 'extralarge', '#text': f'https://img.example/{track_index}.jpg'},
+            ],
+            'mbid': '',
+            'album': {'mbid': '', '#text': album},
+            'name': name,
+            'url': f'https://www.last.fm/music/{artist}/_/{name}',
+            'date': {'uts': str(uts), '#text': time.strftime('%d %b %Y, %H:%M', time.gmtime(uts))},
+        }
+
+    def user_info(self, username):
+        uts, _ = self.scrobbles[username]
+        return {'user': {
+            'name': username,
+            'playcount': str(len(uts)),
+            'registered': {'unixtime': str(uts[-1] if uts else self.now)},
+            'url': f'https://www.last.fm/user/{username}',
+        }}
+
+    def recent_tracks(self, username, start, end, page, limit):
+        uts, picks = self.scrobbles[username]
+        i, j = self._range(username, start, end)
+        total = j - i
+        total_pages = max(1, (total + limit - 1) // limit)
+        first = i + (page - 1) * limit
+        last = min(j, first + limit)
+        return {
+            'recenttracks': {
+                'track': [self.track_json(picks[k], uts[k]) for k in range(first, last)],
+                '@attr': {
+                    'user': username,
+                    'totalPages': str(total_pages),
+                    'page': str(page),
+                    'perPage': str(limit),
+                    'total': str(total),
+                },
+            }
+        }
+
+    def track_info(self, artist, track):
+        index = self.find_track(artist, track)
+        if index is None or self.is_not_found(index):
+            return {'error': 6, 'message': ERROR_MESSAGES[6]}
+        name, artist_name, album, artist_index = self.tracks[index]
+        tags = ['rock', 'indie', 'electronic', 'jazz', 'folk', 'metal', 'pop', 'ambient']
+        return {
+            'track': {
+                'name': name,
+                'mbid': '',
+                'url': f'https://www.last.fm/music/{artist_name}/_/{name}',
+                'duration': str(120000 + (index % 240) * 1000),
+                'listeners': str(1000 + index),
+                'playcount': str(5000 + index * 3),
+                'artist': {'name': artist_name, 'mbid': ''},
+                'album': {'artist': artist_name, 'title': album, 'mbid': ''},
+                'toptags': {'tag': [
+                    {'name': tags[artist_index % len(tags)]},
+                    {'name': tags[(artist_index // len(tags)) % len(tags)]},
+                ]},
+            }
+        }
+
+    def top_albums(self, username, period, page, limit):
+        seconds = TOP_PERIODS.get(period)
+        start = 0 if seconds is None else self.now - seconds
+        uts, picks = self.scrobbles[username]
+        i, j = self._range(username, start, self.now)
+
+        counts = Counter()
+        for k in range(i, j):
+            _, artist, album, _ = self.tracks[picks[k]]
+            counts[(album, artist)] += 1
+        ranked = counts.most_common()
+
+        total_pages = max(1, (len(ranked) + limit - 1) // limit)
+        chunk = ranked[(page - 1) * limit:page * limit]
+        return {
+            'topalbums': {
+                'album': [
+                    {
+                        'name': album,
+                        'playcount': str(plays),
+                        'mbid': '',
+                        'url': f'https://www.last.fm/music/{artist}/{album}',
+                        'artist': {'name': artist, 'mbid': ''},
+                        'image': [{'size': 'extralarge', '#text': ''}],
+                        '@attr': {'rank': str((page - 1) * limit + n + 1)},
+                    }
+                    for n, ((album, artist), plays) in enumerate(chunk)
+                ],
+                '@attr': {
+                    'user': username,
+                    'totalPages': str(total_pages),
+                    'page': str(page),
+                    'perPage': str(limit),
+                    'total': str(len(ranked)),
+                },
+            }
+        }
+
+    def weekly_chart_list(self, username, weeks=12):
+        """user.getweeklychartlist: las últimas `weeks` semanas cerradas, de la más antigua a la más nueva"""
+        # El 4/1/1970 fue domingo
+        anchor = 3 * DAY + 12 * 60 * 60
+        last_end = anchor + (self.now - anchor) // (7 * DAY) * 7 * DAY
+        return {
+            'weeklychartlist': {
+                'chart': [
+                    {'#text': '', 'from': str(last_end - k * 7 * DAY), 'to': str(last_end - (k - 1) * 7 * DAY)}
+                    for k in range(weeks, 0, -1)
+                ],
+                '@attr': {'user': username},
+            }
+        }
+
+    def weekly_chart(self, username, entity, start, end):
+        """user.getweekly{track,album,artist}chart del rango [start, end]"""
+        _, picks = self.scrobbles[username]
+        i, j = self._range(username, start, end)
+
+        counts = Counter()
+        for k in range(i, j):
+            name, artist, album, _ = self.tracks[picks[k]]
+            if entity == 'track':
+                counts[(name, artist)] += 1
+            elif entity == 'album':
+                counts[(album, artist)] += 1
+            else:
+                counts[(artist, None)] += 1
+
+        items = []
+        for rank, ((name, artist), plays) in enumerate(counts.most_common(), start=1):
+            item = {
+                'name': name,
+                'mbid': '',
+                'playcount': str(plays),
+                'url': f'https://www.last.fm/music/{artist or name}',
+                '@attr': {'rank': str(rank)},
+            }
+            if artist is not None:
+                item['artist'] = {'mbid': '', '#text': artist}
+            items.append(item)
+        return {
+            f'weekly{entity}chart': {
+                entity: items,
+                '@attr': {'user': username, 'from': str(start), 'to': str(end)},
+            }
+        }
+
+
+class _Negated:
+    """Vista de una lista con los valores negados, para bisect en orden descendente"""
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return -self.values[i]
+
+
+class FakeLastFM:
+    """
+    Servidor HTTP en un hilo con la API sintética.
+
+    latency_ms/jitter_ms: retardo de cada respuesta.
+    error_rate: fracción de respuestas con error JSON de Last.fm (códigos
+    en error_codes); http_error_rate: fracción de respuestas HTTP 503.
+    """
+    def __init__(self, library=None, host='127.0.0.1', port=0, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, error_codes=(8,), http_error_rate=0.0, seed=1):
+        self.library = library or SyntheticLibrary(seed=seed)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.http_error_rate = http_error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Keep-alive: sin esto cabecera y cuerpo van en segmentos
+            # distintos y el ACK retardado mete ~40 ms por respuesta
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, payload = fake.handle(self.path)
+                body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/2.0/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors),
+                    'total_calls': sum(self.calls.values())}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def _roll(self):
+        with self._lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            http_error = self._rng.random() < self.http_error_rate
+            api_error = None
+            if not http_error and self._rng.random() < self.error_rate:
+                api_error = self._rng.choice(self.error_codes)
+        return delay, http_error, api_error
+
+    def handle(self, path):
+        """Devuelve (status HTTP, JSON) para una petición GET"""
+        query = {k: v[0] for k, v in parse_qs(urlparse(path).query).items()}
+        method = query.get('method', '').lower()
+        with self._lock:
+            self.calls[method] += 1
+
+        delay, http_error, api_error = self._roll()
+        if delay:
+            time.sleep(delay)
+        if http_error:
+            with self._lock:
+                self.errors['http_503'] += 1
+            return 503, None
+        if api_error is not None:
+            with self._lock:
+                self.errors[api_error] += 1
+            return 200, {'error': api_error, 'message': ERROR_MESSAGES.get(api_error, 'Error')}
+
+        library = self.library
+        username = query.get('user') or query.get('username')
+        page = int(query.get('page', 1))
+        try:
+            if method == 'user.getinfo':
+                if username not in library.scrobbles:
+                    return 200, {'error': 6, 'message': 'User not found'}
+                return 200, library.user_info(username)
+            if username in library.private:
+                return 200, {'error': 17, 'message': ERROR_MESSAGES[17]}
+            if method == 'user.getrecenttracks':
+                if username not in library.scrobbles:
+                    return 200, {'error': 6, 'message': 'User not found'}
+                return 200, library.recent_tracks(
+                    username,
+                    int(query.get('from', 0)),
+                    int(query.get('to', library.now)),
+                    page,
+                    min(int(query.get('limit', 50)), 200),
+                )
+            if method == 'user.getweeklychartlist':
+                if username not in library.scrobbles:
+                    return 200, {'error': 6, 'message': 'User not found'}
+                return 200, library.weekly_chart_list(username)
+            if method in ('user.getweeklytrackchart', 'user.getweeklyalbumchart',
+                          'user.getweeklyartistchart'):
+                if username not in library.scrobbles:
+                    return 200, {'error': 6, 'message': 'User not found'}
+                entity = method[len('user.getweekly'):-len('chart')]
+                return 200, library.weekly_chart(
+                    username, entity,
+                    int(query.get('from', library.now - 7 * DAY)),
+                    int(query.get('to', library.now)),
+                )
+            if method == 'track.getinfo':
+                return 200, library.track_info(query.get('artist', ''), query.get('track', ''))
+            if method == 'user.gettopalbums':
+                if username not in library.scrobbles:
+                    return 200, {'error': 6, 'message': 'User not found'}
+                return 200, library.top_albums(
+                    username, query.get('period', 'overall'), page,
+                    min(int(query.get('limit', 50)), 1000),
+                )
+        except ValueError:
+            return 200, {'error': 6, 'message': 'Invalid parameters'}
+        return 200, {'error': 3, 'message': 'Invalid Method - No method with that name in this package'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita la API de Last.fm')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--users', type=int, default=13)
+    parser.add_argument('--scrobbles-per-day', type=int, default=60)
+    parser.add_argument('--days', type=int, default=35)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-codes', type=int, nargs='+', default=[8])
+    parser.add_argument('--http-error-rate', type=float, default=0.0)
+    parser.add_argument('--private-users', type=int, default=0)
+    args = parser.parse_args()
+
+    library = SyntheticLibrary(users=args.users, scrobbles_per_day=args.scrobbles_per_day,
+                               days=args.days, seed=args.seed, private_users=args.private_users)
+    fake = FakeLastFM(library, host=args.host, port=args.port, latency_ms=args.latency_ms,
+                      jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                      error_codes=args.error_codes, http_error_rate=args.http_error_rate,
+                      seed=args.seed)
+    print(f"🎧 Last.fm falso en {fake.url} con usuarios: {', '.join(library.usernames)}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Detector de obsesiones sobre todo el historial de scrobbles.
+
+Trabaja sobre las columnas de ScrobbleArchive. Cada escucha cae en una
+semana o un mes. Para cada (usuario, canción o artista, periodo) se
+compara lo escuchado con las `history` ventanas anteriores del mismo
+usuario y se calcula un z-score. Las ventanas sin escuchas cuentan como
+cero. Todos los usuarios se procesan de una vez con NumPy, sin bucles
+por elemento:
+
+    clave   = (usuario, elemento, periodo)  ->  np.unique + conteo
+    ventana = searchsorted sobre las claves + sumas acumuladas
+
+La desviación típica se toma como mínimo 1 escucha. Así, algo que sale
+de la nada no da un z infinito, pero sigue destacando si se escucha mucho.
+"""
+import csv
+from datetime import datetime, timezone
+
+import numpy as np
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+COLUMNS = ('usuario', 'tipo', 'ventana', 'periodo', 'elemento', 'artista', 'escuchas', 'media', 'z')
+
+
+def period_index(uts, window):
+    """Índice de semana (empezando en lunes) o de mes de cada uts"""
+    uts = np.asarray(uts, dtype=np.int64)
+    if window == 'week':
+        # El 1/1/1970 fue jueves: +3 días hace que las semanas empiecen en lunes
+        return (uts + 3 * DAY) // WEEK
+    if window == 'month':
+        return uts.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"Ventana no soportada: {window}")
+
+
+def period_label(index, window):
+    """'YYYY-MM-DD' del lunes de la semana o 'YYYY-MM' del mes"""
+    if window == 'week':
+        start = int(index) * WEEK - 3 * DAY
+        return datetime.fromtimestamp(start, timezone.utc).strftime('%Y-%m-%d')
+    return str(np.datetime64(int(index), 'M'))
+
+
+def window_scores(users, items, periods, history=12, min_history=4):
+    """
+    z-score de cada (usuario, elemento, periodo) con escuchas.
+
+    users, items y periods son arrays del mismo largo (una fila por
+    scrobble). Devuelve arrays (users, items, periods, plays, mean, z),
+    uno por combinación. z es NaN si el usuario no tiene aún min_history
+    periodos anteriores.
+    """
+    users = np.asarray(users, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64)
+    periods = np.asarray(periods, dtype=np.int64)
+    if len(users) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty, np.empty(0), np.empty(0)
+
+    first_period = periods.min()
+    periods = periods - first_period
+    n_periods = int(periods.max()) + 1
+    n_items = int(items.max()) + 1
+
+    keys, plays = np.unique((users * n_items + items) * n_periods + periods, return_counts=True)
+    pair, period = np.divmod(keys, n_periods)
+    user = pair // n_items
+
+    # Sumas de las ventanas [periodo - history, periodo) del mismo par
+    cum = np.concatenate(([0], np.cumsum(plays)))
+    cum_sq = np.concatenate(([0], np.cumsum(plays * plays)))
+    lo = np.searchsorted(keys, pair * n_periods + np.maximum(period - history, 0), side='left')
+    hi = np.arange(len(keys))
+    total = cum[hi] - cum[lo]
+    total_sq = cum_sq[hi] - cum_sq[lo]
+
+    # Periodos anteriores en los que el usuario ya tenía historial
+    user_start = np.full(int(users.max()) + 1, n_periods, dtype=np.int64)
+    np.minimum.at(user_start, users, periods)
+    seen = np.minimum(history, period - user_start[user])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / seen
+        std = np.sqrt(np.maximum(total_sq / seen - mean * mean, 0))
+        z = (plays - mean) / np.maximum(std, 1.0)
+    z[seen < min_history] = np.nan
+    return user, pair % n_items, period + first_period, plays, mean, z
+
+
+def detect_binges(archive, kind='song', window='week', history=12, min_history=4,
+                  z_min=3.0, min_plays=10):
+    """
+    Obsesiones de todos los usuarios en el archivo: filas con el orden de
+    COLUMNS, de mayor a menor z. kind es 'song' (canción sin mirar el
+    álbum), 'track', 'album' o 'artist'.
+    """
+    if not len(archive):
+        return []
+    rows = archive.period()
+    user, item, period, plays, mean, z = window_scores(
+        archive.columns['user'][rows],
+        archive.column(kind, rows),
+        period_index(archive.columns['uts'][rows], window),
+        history, min_history
+    )
+    flagged = np.flatnonzero((plays >= min_plays) & (z >= z_min))
+    flagged = flagged[np.argsort(-z[flagged], kind='stable')]
+
+    binges = []
+    for i in flagged:
+        name = archive.name(kind, int(item[i]))
+        if kind == 'artist':
+            element, artist = name, ''
+        else:
+            element, artist = name[0], name[1]
+        binges.append((
+            archive.users[user[i]], kind, window, period_label(period[i], window),
+            element, artist, int(plays[i]), round(float(mean[i]), 2), round(float(z[i]), 2)
+        ))
+    return binges
+
+
+def detect_all(archive, kinds=('song', 'artist'), windows=('week', 'month'), **options):
+    """detect_binges de cada tipo y ventana, en una sola tabla"""
+    return [
+        row
+        for kind in kinds
+        for window in windows
+        for row in detect_binges(archive, kind, window, **options)
+    ]
+
+
+def write_csv(path, binges):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(binges)
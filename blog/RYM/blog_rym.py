@@ -1,11 +1,23 @@
-import requests
-from collections import defaultdict
 from dotenv import load_dotenv
+import io
 import os
 import markdown
 import sys
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+from lastfm_client import LastFMClient
+from recent_tracks import PageFetchError
+from retry_policy import STATS as RETRY_STATS
+from roster import Roster
+from scrobble_aggregator import CoincidenceIndex, ScrobbleAggregator
+from scrobble_source import ScrobbleSource
+from scrobble_store import ScrobbleStore
+from stats_markdown import atomic_open, write_coincidences, write_user_tops
+from weekly_dataset import write_dataset
+
 load_dotenv()
 
 
@@ -15,6 +27,8 @@ BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 fecha_actual = datetime.now()
 fecha_formateada = fecha_actual.strftime("%d-%m-%Y")
 filename="/home/pepe/hugo/web/rym/lastfm_weekly_stats.md"
+# Mismos datos en JSON Lines para los scripts de graficos/
+dataset_filename = os.path.splitext(filename)[0] + ".jsonl"
 
 # Lista de usuarios que quieres analizar
 USERNAMES = [
@@ -33,260 +47,200 @@ USERNAMES = [
     "sdecandelario"
 ]
 class LastFMStats:
-    def __init__(self, api_key, usernames):
+    def __init__(self, api_key, usernames, workers=1, page_workers=4, store=None, use_charts=False, roster=None):
         self.api_key = api_key
         self.usernames = usernames
-        self.base_url = "http://ws.audioscrobbler.com/2.0/"
-        self.week_ago = int((datetime.now() - timedelta(days=7)).timestamp())
+        # Sesión HTTP compartida (keep-alive, gzip, límite de 5 peticiones/s)
+        self.client = LastFMClient(api_key)
+        # Número de usuarios consultados a la vez; 1 mantiene el modo secuencial
+        self.workers = max(1, workers)
+        # Scrobbles de los últimos 7 días: API, archivo local y roster
+        now = datetime.now()
+        self.source = ScrobbleSource(
+            self.client,
+            int((now - timedelta(days=7)).timestamp()),
+            int(now.timestamp()),
+            store=store, roster=roster, workers=self.workers, page_workers=page_workers
+        )
+        # Charts semanales ya agregados por Last.fm: 3 llamadas por usuario
+        self.use_charts = use_charts
 
-    def _make_request(self, method, username, params=None):
-        default_params = {
-            'method': method,
-            'api_key': self.api_key,
-            'username': username,
-            'format': 'json',
-        }
-        if params:
-            default_params.update(params)
-        
-        try:
-            print(f"🔍 Consultando datos para {username}...", file=sys.stderr)
-            response = requests.get(self.base_url, params=default_params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Error consultando datos para {username}: {e}", file=sys.stderr)
+    @staticmethod
+    def _chart_items(data, chart, entity):
+        """Lista de elementos de un chart semanal; None si la respuesta no vale"""
+        if not data or 'error' in data or chart not in data:
             return None
+        items = data[chart].get(entity, [])
+        # Con un solo elemento la API devuelve un dict en vez de una lista
+        return [items] if isinstance(items, dict) else items
+
+    def _chart_week(self):
+        """
+        (from, to) de la última semana de user.getweeklychartlist, o None.
+        Last.fm sólo sirve los charts de esas semanas fijas, no de cualquier
+        rango: se pregunta al primer usuario que responda.
+        """
+        for username in self.usernames:
+            data = self.source.request('user.getweeklychartlist', username, {'user': username})
+            weeks = self._chart_items(data, 'weeklychartlist', 'chart')
+            if weeks:
+                week = max(weeks, key=lambda week: int(week['to']))
+                return int(week['from']), int(week['to'])
+        return None
+
+    def _use_chart_week(self):
+        """Con --charts, toda la semana (charts y paginación) pasa a ser la del último chart"""
+        week = self._chart_week()
+        if week is None:
+            print("⚠️ Sin lista de charts semanales, se paginan los scrobbles de los últimos 7 días",
+                  file=sys.stderr)
+            self.use_charts = False
+            return
+        self.source.start, self.source.end = week
+        print(f"📅 Semana de los charts: {datetime.fromtimestamp(week[0])} - "
+              f"{datetime.fromtimestamp(week[1])}", file=sys.stderr)
+
+    def _get_weekly_charts(self, username):
+        """
+        (tracks, albums, artists) desde user.getweekly*chart, con la misma
+        forma que ScrobbleAggregator. None si falla alguna de las tres.
+
+        El chart de canciones no trae álbum: esa columna queda vacía. El
+        rango es la semana de _use_chart_week.
+        """
+        params = {'user': username, 'from': self.source.start, 'to': self.source.end}
+        track_items = self._chart_items(
+            self.source.request('user.getweeklytrackchart', username, params), 'weeklytrackchart', 'track')
+        album_items = self._chart_items(
+            self.source.request('user.getweeklyalbumchart', username, params), 'weeklyalbumchart', 'album')
+        artist_items = self._chart_items(
+            self.source.request('user.getweeklyartistchart', username, params), 'weeklyartistchart', 'artist')
+        if track_items is None or album_items is None or artist_items is None:
+            return None
+
+        tracks = {}
+        for item in track_items:
+            key = (item.get('name', 'Unknown Track'), item.get('artist', {}).get('#text', 'Unknown Artist'), '')
+            tracks[key] = tracks.get(key, 0) + int(item.get('playcount', 0))
+
+        albums = defaultdict(dict)
+        for item in album_items:
+            artist = item.get('artist', {}).get('#text', 'Unknown Artist')
+            albums[item.get('name', 'Unknown Album')][artist] = int(item.get('playcount', 0))
+
+        artists = {item.get('name', 'Unknown Artist'): int(item.get('playcount', 0)) for item in artist_items}
+        return tracks, albums, artists
 
     def get_tracks_last_week(self, username):
-        tracks = defaultdict(int)
-        albums = defaultdict(lambda: defaultdict(int))
-        artists = defaultdict(int)
+        # Sin tope de escuchas: la memoria depende de canciones distintas, no de scrobbles
+        aggregator = ScrobbleAggregator()
         
         try:
-            page = 1
-            tracks_in_week = 0
-            max_tracks_per_user = 1000
-            total_tracks_found = 0
-            
-            while True:
-                print(f"🔍 Debugging {username}: Página {page}", file=sys.stderr)
-                
-                params = {
-                    'page': page,
-                    'limit': 200,
-                    'from': self.week_ago
-                }
-                data = self._make_request('user.getrecenttracks', username, params)
-                
-                if not data:
-                    print(f"❌ NO DATA for {username}", file=sys.stderr)
-                    return None, None, None
-                
-                if 'recenttracks' not in data:
-                    print(f"❌ NO RECENTTRACKS for {username}", file=sys.stderr)
-                    print(f"API Response: {data}", file=sys.stderr)
-                    return None, None, None
-                
-                tracks_list = data['recenttracks'].get('track', [])
-                print(f"📊 Tracks in this page: {len(tracks_list)}", file=sys.stderr)
-                
-                if not tracks_list:
-                    print(f"❌ EMPTY TRACKS LIST for {username}", file=sys.stderr)
-                    break
-                
-                for track in tracks_list:
-                    # Skip now playing track if needed
-                    if track.get('nowplaying', False):
-                        print("⏭️ Skipping now playing track", file=sys.stderr)
-                        continue
-                    
-                    # Ensure track has a date
-                    track_date = int(track.get('date', {}).get('uts', 0))
-                    
-                    track_name = track.get('name', 'Unknown Track')
-                    artist_name = track.get('artist', {}).get('#text', 'Unknown Artist')
-                    album_name = track.get('album', {}).get('#text', 'Unknown Album')
-                    
-                    # Add track details
-                    tracks[(track_name, artist_name, album_name)] += 1
-                    albums[album_name][artist_name] += 1
-                    artists[artist_name] += 1
-                    
-                    total_tracks_found += 1
-                    tracks_in_week += 1
-                    
-                    if tracks_in_week >= max_tracks_per_user:
-                        break
-                
-                print(f"🎵 Total tracks found so far: {total_tracks_found}", file=sys.stderr)
-                
-                # Check pagination
-                total_pages = int(data['recenttracks']['@attr'].get('totalPages', 1))
-                print(f"📄 Total pages: {total_pages}, Current page: {page}", file=sys.stderr)
-                
-                if page >= total_pages or tracks_in_week >= max_tracks_per_user:
-                    break
-                
-                page += 1
+            if self.use_charts:
+                charts = self._get_weekly_charts(username)
+                if charts is not None:
+                    print(f"📈 Charts semanales para {username}: {sum(charts[2].values())} escuchas",
+                          file=sys.stderr)
+                    return charts
+                # Sin charts se cuentan los scrobbles uno a uno, como siempre
+                print(f"⚠️ Sin charts semanales para {username}, paginando scrobbles", file=sys.stderr)
+
+            total_tracks_found = aggregator.consume(self.source.scrobbles(username))
             
             print(f"✅ Final track count for {username}: {total_tracks_found}", file=sys.stderr)
-            return tracks, albums, artists
+            return aggregator.tracks(), aggregator.albums(), aggregator.artists()
         
+        except PageFetchError as e:
+            print(f"❌ NO DATA for {username}: {e}", file=sys.stderr)
+            if e.data:
+                print(f"API Response: {e.data}", file=sys.stderr)
+            return None, None, None
         except Exception as e:
             print(f"❌ EXCEPTION for {username}: {e}", file=sys.stderr)
             import traceback
             traceback.print_exc(file=sys.stderr)
             return None, None, None
-    def get_top_10(self, data):
-        return dict(sorted(data.items(), key=lambda x: x[1], reverse=True)[:10])
 
-    def generate_markdown(self):
+    def fetch_all_users(self):
+        """Obtiene las escuchas de todos los usuarios, en paralelo si workers > 1"""
+        if self.workers == 1:
+            return [self.get_tracks_last_week(user) for user in self.usernames]
+
+        # map() conserva el orden de self.usernames, así que el resultado
+        # es idéntico al del modo secuencial
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.get_tracks_last_week, self.usernames))
+
+    def collect(self):
+        """Descarga todos los usuarios; deja self.users_data y devuelve el índice de coincidencias"""
+        self.usernames = self.source.filter_users(self.usernames)
+        if self.use_charts:
+            self._use_chart_week()
         valid_users_data = {}
-        for user in self.usernames:
-            user_tracks, user_albums, user_artists = self.get_tracks_last_week(user)
+        # Índice invertido elemento -> {usuario: escuchas} para las coincidencias
+        index = CoincidenceIndex()
+        for user, user_data in zip(self.usernames, self.fetch_all_users()):
+            user_tracks, user_albums, user_artists = user_data
             if user_tracks is not None:
                 valid_users_data[user] = {
                     'tracks': user_tracks,
                     'albums': user_albums,
                     'artists': user_artists
                 }
+                index.add_user(user, user_tracks, user_albums, user_artists)
         
         self.usernames = list(valid_users_data.keys())
+        self.users_data = valid_users_data
         
-        md_content = "# Estadísticas semanales en Last.fm\n\n"
-        
-        # Coincidencias
-        md_content += "## Coincidencias entre Usuarios\n\n"
-        
-        # Canciones compartidas - Ordenar por número de usuarios
-        md_content += "### Canciones\n"
-        md_content += "| Canción | Artista | Álbum | Usuarios |\n"
-        md_content += "|---------|---------|-------|----------|\n"
-        
-        shared_tracks = {}
-        all_tracks = set()
-        for user_data in valid_users_data.values():
-            all_tracks.update(user_data['tracks'].keys())
-        
-        for track in all_tracks:
-            track_users = {}
-            for user, user_data in valid_users_data.items():
-                if track in user_data['tracks']:
-                    track_users[user] = user_data['tracks'][track]
-            
-            if len(track_users) > 1:
-                track_name, artist_name, album_name = track
-                shared_tracks[track] = {
-                    'track_name': track_name,
-                    'artist_name': artist_name,
-                    'album_name': album_name,
-                    'users': track_users
-                }
-        
-        # Ordenar tracks por número de usuarios (de mayor a menor)
-        sorted_tracks = sorted(
-            shared_tracks.values(), 
-            key=lambda x: len(x['users']), 
-            reverse=True
-        )
-        
-        for track_info in sorted_tracks:
-            user_plays = [f"{user} ({plays})" for user, plays in track_info['users'].items()]
-            md_content += f"| {track_info['track_name']} | {track_info['artist_name']} | {track_info['album_name']} | {', '.join(user_plays)} |\n"
-        
-        # Álbumes compartidos - Ordenar por número de usuarios
-        md_content += "\n### Álbumes\n"
-        md_content += "| Álbum | Artista | Usuarios |\n"
-        md_content += "|-------|---------|----------|\n"
-        
-        shared_albums = {}
-        all_albums = set()
-        for user_data in valid_users_data.values():
-            all_albums.update(user_data['albums'].keys())
-        
-        for album in all_albums:
-            album_users = {}
-            for user, user_data in valid_users_data.items():
-                if album in user_data['albums']:
-                    album_users[user] = sum(user_data['albums'][album].values())
-            
-            if len(album_users) > 1:
-                artist = next(iter(set(artist for user_data in valid_users_data.values() for artist in user_data['albums'][album].keys())))
-                shared_albums[album] = {
-                    'album': album,
-                    'artist': artist,
-                    'users': album_users
-                }
-        
-        # Ordenar álbumes por número de usuarios (de mayor a menor)
-        sorted_albums = sorted(
-            shared_albums.values(), 
-            key=lambda x: len(x['users']), 
-            reverse=True
-        )
-        
-        for album_info in sorted_albums:
-            user_plays = [f"{user} ({plays})" for user, plays in album_info['users'].items()]
-            md_content += f"| {album_info['album']} | {album_info['artist']} | {', '.join(user_plays)} |\n"
-        
-        # Artistas compartidos - Ordenar por número de usuarios
-        md_content += "\n### Artistas\n"
-        md_content += "| Artista | Usuarios |\n"
-        md_content += "|---------|----------|\n"
-        
-        shared_artists = {}
-        all_artists = set()
-        for user_data in valid_users_data.values():
-            all_artists.update(user_data['artists'].keys())
-        
-        for artist in all_artists:
-            artist_users = {}
-            for user, user_data in valid_users_data.items():
-                if artist in user_data['artists']:
-                    artist_users[user] = user_data['artists'][artist]
-            
-            if len(artist_users) > 1:
-                shared_artists[artist] = artist_users
-        
-        # Ordenar artistas por número de usuarios (de mayor a menor)
-        sorted_artists = sorted(
-            shared_artists.items(), 
-            key=lambda x: len(x[1]), 
-            reverse=True
-        )
-        
-        for artist, artist_users in sorted_artists:
-            user_plays = [f"{user} ({plays})" for user, plays in artist_users.items()]
-            md_content += f"| {artist} | {', '.join(user_plays)} |\n"
-        
-        # Top 10 por usuario (sin cambios)
-        for user, data in valid_users_data.items():
-            md_content += f"## Top 10 para {user}\n\n"
-            
-            md_content += "*Top Artistas*\n"
-            md_content += "| Artista | Reproducciones |\n|---------|----------------|\n"
-            for artist, plays in self.get_top_10(data['artists']).items():
-                md_content += f"| {artist} | {plays} |\n"
-            md_content += "\n"
+        return index
 
-            md_content += "*Top Canciones*\n"
-            md_content += "| Canción | Artista | Álbum | Reproducciones |\n|---------|----------|-------|----------------|\n"
-            for (track, artist, album), plays in self.get_top_10(data['tracks']).items():
-                md_content += f"| {track} | {artist} | {album} | {plays} |\n"
-            md_content += "\n"
-        
-        return md_content
+    def write_markdown(self, out, index):
+        """Escribe el post en `out` (fichero o StringIO) fila a fila"""
+        out.write("# Estadísticas semanales en Last.fm\n\n")
+        write_coincidences(out, index)
+        write_user_tops(out, self.users_data)
 
-    def save_markdown(self, filename):
-        content = self.generate_markdown()
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(content)
+    def generate_markdown(self):
+        out = io.StringIO()
+        self.write_markdown(out, self.collect())
+        return out.getvalue()
+
+    def save_markdown(self, filename, dataset=None):
+        index = self.collect()
+        # Temporal + rename: Hugo nunca lee un post a medias
+        with atomic_open(filename) as f:
+            self.write_markdown(f, index)
+        if dataset:
+            write_dataset(dataset, self.users_data)
 
 # Ejemplo de uso
 def main():
-    lastfm_stats = LastFMStats(API_KEY, USERNAMES)
-    lastfm_stats.save_markdown(filename)
+    parser = argparse.ArgumentParser(description='Estadísticas semanales de Last.fm')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Usuarios consultados en paralelo (1 = secuencial)')
+    parser.add_argument('--page-workers', type=int, default=4,
+                        help='Páginas de un usuario pedidas en paralelo tras la primera')
+    parser.add_argument('--no-store', action='store_true',
+                        help='No usar el archivo local de scrobbles, paginar la API entera')
+    parser.add_argument('--no-roster', action='store_true',
+                        help='Consultar también los perfiles marcados como privados o inexistentes')
+    parser.add_argument('--charts', action='store_true',
+                        help='Usar user.getweekly*chart (3 llamadas por usuario) y paginar sólo si fallan. '
+                             'La semana pasa a ser la última de user.getweeklychartlist (de domingo '
+                             'a domingo), no los últimos 7 días')
+    parser.add_argument('--dataset', default=dataset_filename,
+                        help='Dataset .jsonl o .parquet para los gráficos')
+    parser.add_argument('--no-dataset', action='store_true',
+                        help='Escribir sólo el markdown')
+    args = parser.parse_args()
+
+    store = None if args.no_store else ScrobbleStore(page_workers=args.page_workers)
+    roster = None if args.no_roster else Roster()
+    lastfm_stats = LastFMStats(API_KEY, USERNAMES, workers=args.workers,
+                               page_workers=args.page_workers, store=store, use_charts=args.charts,
+                               roster=roster)
+    lastfm_stats.save_markdown(filename, dataset=None if args.no_dataset else args.dataset)
+    print(f"🔁 Reintentos Last.fm: {RETRY_STATS.summary()}", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
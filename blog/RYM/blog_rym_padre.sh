@@ -47,8 +47,9 @@ weekly_script() {
     semanal="$RYM_BLOG/content/semanal/$fecha.md"
     
     if [ -f "$RYM_BLOG/lastfm_weekly_stats.md" ]; then rm "$RYM_BLOG/lastfm_weekly_stats.md";fi
+    if [ -f "$RYM_BLOG/lastfm_weekly_stats.jsonl" ]; then rm "$RYM_BLOG/lastfm_weekly_stats.jsonl";fi
     
-    python3 "$RYM_SCRIPTS/blog_rym.py" || {
+    python3 "$RYM_SCRIPTS/blog_rym.py" --workers 4 || {
         send_telegram_message "❌ Error in blog_rym.py. Check log at /tmp/rym_script_log.txt" "Markdown"
         return 1
     }
@@ -188,8 +189,8 @@ echo "Creando estadisticas graficas semanales"
 if $weekly_script_ran; then
     fecha=$(date +"%d-%m-%y")
     periodo="semanal"
-    # Markdown semanal a leer
-    archivo_md="$RYM_BLOG/content/$periodo/$fecha.md"
+    # Dataset semanal a leer (lo escribe blog_rym.py junto al markdown)
+    archivo_md="$RYM_BLOG/lastfm_weekly_stats.jsonl"
     
     # crear carpeta para las graficas
     mkdir -p "$RYM_BLOG"/static/graficos/"$periodo"/"$fecha"/{canciones artistas albumes}
@@ -1,24 +1,125 @@
+import argparse
 import json
 import sqlite3
 import logging
 import sys
 from pathlib import Path
-import time
 from datetime import datetime
 import requests
 from urllib.parse import quote
 import base64
 import os
-import musicbrainzngs as mb
+from collections import OrderedDict
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lastfm_client import LastFMClient
+from rate_limiter import get_limiter
+
 load_dotenv()
 
+# Columnas por las que get_or_create_record busca cada dimensión, en orden
+ID_CACHE_KEYS = {
+    'users': ('username',),
+    'artists': ('name',),
+    'albums': ('name', 'artist_id'),
+    'tracks': ('name', 'artist_id', 'album_id'),
+    'genres': ('name', 'source_id'),
+    'genre_sources': ('name',),
+}
+DEFAULT_ID_CACHE_SIZE = 200000
+
+# Fuentes de géneros: (hilos, timeout en segundos de cada petición). El
+# ritmo lo marca el presupuesto de cada una en rate_limiter.SERVICE_BUDGETS;
+# los hilos sólo tienen que bastar para cubrirlo mientras se espera la red
+GENRE_SOURCES = {
+    'lastfm': (5, 10),
+    'spotify': (4, 10),
+    'musicbrainz': (1, 15),
+    'discogs': (2, 15),
+}
+# Canciones en vuelo a la vez en resolve_genres
+GENRE_CHUNK_SIZE = 500
+# Fallos seguidos tras los que una fuente deja de consultarse en esta carga
+GENRE_SOURCE_MAX_FAILURES = 10
+
+# Estadísticas por usuario recalculadas desde user_plays (--defer-stats):
+# tabla -> (columna, SELECT user_id, columna, play_count, first_played, last_played)
+USER_STATS_ROLLUPS = {
+    'user_track_stats': ('track_id', """
+        SELECT p.user_id, p.track_id, COUNT(*), MIN(p.timestamp), MAX(p.timestamp)
+        FROM user_plays p
+        WHERE p.user_id IN (SELECT user_id FROM temp.stats_users)
+        GROUP BY p.user_id, p.track_id
+    """),
+    'user_artist_stats': ('artist_id', """
+        SELECT p.user_id, t.artist_id, COUNT(*), MIN(p.timestamp), MAX(p.timestamp)
+        FROM user_plays p JOIN tracks t ON t.id = p.track_id
+        WHERE p.user_id IN (SELECT user_id FROM temp.stats_users)
+        GROUP BY p.user_id, t.artist_id
+    """),
+    'user_album_stats': ('album_id', """
+        SELECT p.user_id, t.album_id, COUNT(*), MIN(p.timestamp), MAX(p.timestamp)
+        FROM user_plays p JOIN tracks t ON t.id = p.track_id
+        WHERE p.user_id IN (SELECT user_id FROM temp.stats_users) AND t.album_id IS NOT NULL
+        GROUP BY p.user_id, t.album_id
+    """),
+    'user_genre_stats': ('genre_id', """
+        SELECT p.user_id, tg.genre_id, COUNT(*), MIN(p.timestamp), MAX(p.timestamp)
+        FROM user_plays p JOIN track_genres tg ON tg.track_id = p.track_id
+        WHERE p.user_id IN (SELECT user_id FROM temp.stats_users)
+        GROUP BY p.user_id, tg.genre_id
+    """),
+}
+
+
+class IdCache:
+    """clave -> id de una tabla, con tope LRU y contadores de aciertos"""
+    def __init__(self, maxsize=DEFAULT_ID_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.ids.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.ids.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.ids[key] = value
+        self.ids.move_to_end(key)
+        if len(self.ids) > self.maxsize:
+            self.ids.popitem(last=False)
+
+    def clear(self):
+        self.ids.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.ids),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
 class LastFMDatabaseLoader:
-    def __init__(self, db_path, checkpoint_path, schema_path):
+    def __init__(self, db_path, checkpoint_path, schema_path, id_cache_size=DEFAULT_ID_CACHE_SIZE):
         self.db_path = db_path
         self.checkpoint_path = Path(checkpoint_path)
         self.schema_path = schema_path
+        # IDs ya resueltos de cada dimensión; se escriben a la vez que la BD
+        self.id_caches = {table: IdCache(id_cache_size) for table in ID_CACHE_KEYS}
+        # (artista, canción, mbid) -> [(fuente, género)], resuelto en enrich_genres
+        self.track_genres = {}
         
         # Configurar APIs
         self.setup_apis()
@@ -38,6 +139,7 @@ class LastFMDatabaseLoader:
         """Configurar las APIs necesarias"""
         # Last.fm
         self.lastfm_api_key = os.getenv('LASTFM_API_KEY')
+        self.lastfm_client = LastFMClient(self.lastfm_api_key) if self.lastfm_api_key else None
         
         # Spotify
         self.spotify_client_id = os.getenv('SPOTIFY_CLIENT_ID')
@@ -45,15 +147,20 @@ class LastFMDatabaseLoader:
         self.spotify_token = self.get_spotify_token()
         
         # MusicBrainz
-        mb.set_useragent(
-            "MusicLibraryEnricher",
-            "1.0",
-            os.getenv('CONTACT_EMAIL', 'your@email.com')
-        )
+        self.musicbrainz_headers = {
+            'User-Agent': f"MusicLibraryEnricher/1.0 ( {os.getenv('CONTACT_EMAIL', 'your@email.com')} )",
+            'Accept': 'application/json',
+        }
         
         # Discogs
         self.discogs_token = os.getenv('DISCOGS_TOKEN')
 
+        # Un pool de hilos por fuente de géneros (se crean al usarlos) y sus
+        # fallos seguidos: una fuente caída no frena al resto
+        self.genre_pools = {}
+        self.genre_failures = {source: 0 for source in GENRE_SOURCES}
+        self.genre_lock = threading.Lock()
+
     def setup_database(self):
         """Crear el esquema de la base de datos"""
         with sqlite3.connect(self.db_path) as conn:
@@ -85,69 +192,175 @@ class LastFMDatabaseLoader:
             self.logger.error(f"Error obteniendo token de Spotify: {str(e)}")
             return None
 
-    def get_genres_from_apis(self, artist_name, track_name, mbid):
-        """Obtener géneros de todas las APIs disponibles"""
-        genres = []
-        
-        # Last.fm
-        if self.lastfm_api_key:
-            url = f"http://ws.audioscrobbler.com/2.0/?method=track.getInfo&api_key={self.lastfm_api_key}&artist={quote(artist_name)}&track={quote(track_name)}&format=json"
-            try:
-                response = requests.get(url)
-                data = response.json()
-                if 'track' in data and 'toptags' in data['track']:
-                    for tag in data['track']['toptags']['tag']:
-                        genres.append(('lastfm', tag['name']))
-            except Exception as e:
-                self.logger.error(f"Error con Last.fm API: {str(e)}")
-
-        # Spotify
+    def lastfm_genres(self, artist_name, track_name, mbid, timeout):
+        response = self.lastfm_client.request(
+            'track.getInfo', {'artist': artist_name, 'track': track_name}, timeout=timeout
+        )
+        data = response.json()
+        if 'track' in data and 'toptags' in data['track']:
+            return [('lastfm', tag['name']) for tag in data['track']['toptags']['tag']]
+        return []
+
+    def spotify_genres(self, artist_name, track_name, mbid, timeout):
+        headers = {"Authorization": f"Bearer {self.spotify_token}"}
+        search_url = f"https://api.spotify.com/v1/search?q=track:{quote(track_name)}+artist:{quote(artist_name)}&type=track&limit=1"
+        get_limiter('spotify').wait()
+        data = requests.get(search_url, headers=headers, timeout=timeout).json()
+        if not ('tracks' in data and 'items' in data['tracks'] and data['tracks']['items']):
+            return []
+        artist_id = data['tracks']['items'][0]['artists'][0]['id']
+        artist_url = f"https://api.spotify.com/v1/artists/{artist_id}"
+        get_limiter('spotify').wait()
+        artist_data = requests.get(artist_url, headers=headers, timeout=timeout).json()
+        return [('spotify', genre) for genre in artist_data.get('genres', [])]
+
+    def musicbrainz_genres(self, artist_name, track_name, mbid, timeout):
+        get_limiter('musicbrainz').wait()
+        response = requests.get(
+            f"https://musicbrainz.org/ws/2/recording/{quote(mbid)}",
+            params={'inc': 'tags', 'fmt': 'json'},
+            headers=self.musicbrainz_headers,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return [('musicbrainz', tag['name']) for tag in response.json().get('tags', [])]
+
+    def discogs_genres(self, artist_name, track_name, mbid, timeout):
+        headers = {'Authorization': f'Discogs token={self.discogs_token}'}
+        search_url = f"https://api.discogs.com/database/search?q={quote(f'{artist_name} {track_name}')}&type=release"
+        get_limiter('discogs').wait()
+        data = requests.get(search_url, headers=headers, timeout=timeout).json()
+        if not ('results' in data and data['results']):
+            return []
+        result = data['results'][0]
+        return ([('discogs_genre', genre) for genre in result.get('genre', [])]
+                + [('discogs_style', style) for style in result.get('style', [])])
+
+    def genre_fetchers(self, mbid):
+        """{fuente: función} de las fuentes que se pueden consultar para una canción"""
+        fetchers = {}
+        if self.lastfm_client:
+            fetchers['lastfm'] = self.lastfm_genres
         if self.spotify_token:
-            headers = {"Authorization": f"Bearer {self.spotify_token}"}
-            search_url = f"https://api.spotify.com/v1/search?q=track:{quote(track_name)}+artist:{quote(artist_name)}&type=track&limit=1"
-            try:
-                response = requests.get(search_url, headers=headers)
-                data = response.json()
-                if 'tracks' in data and 'items' in data['tracks'] and data['tracks']['items']:
-                    track = data['tracks']['items'][0]
-                    artist_id = track['artists'][0]['id']
-                    artist_url = f"https://api.spotify.com/v1/artists/{artist_id}"
-                    artist_response = requests.get(artist_url, headers=headers)
-                    artist_data = artist_response.json()
-                    for genre in artist_data.get('genres', []):
-                        genres.append(('spotify', genre))
-            except Exception as e:
-                self.logger.error(f"Error con Spotify API: {str(e)}")
-
-        # MusicBrainz
+            fetchers['spotify'] = self.spotify_genres
         if mbid:
-            try:
-                result = mb.get_recording_by_id(mbid, includes=['tags'])
-                for tag in result['recording'].get('tag-list', []):
-                    genres.append(('musicbrainz', tag['name']))
-                    sleep = random.uniform(0.1, 0.5)
-                    time.sleep(sleep)
-            except Exception as e:
-                self.logger.error(f"Error con MusicBrainz API: {str(e)}")
-
-        # Discogs
+            fetchers['musicbrainz'] = self.musicbrainz_genres
         if self.discogs_token:
-            headers = {'Authorization': f'Discogs token={self.discogs_token}'}
-            search_url = f"https://api.discogs.com/database/search?q={quote(f'{artist_name} {track_name}')}&type=release"
-            try:
-                response = requests.get(search_url, headers=headers)
-                data = response.json()
-                if 'results' in data and data['results']:
-                    result = data['results'][0]
-                    for genre in result.get('genre', []):
-                        genres.append(('discogs_genre', genre))
-                    for style in result.get('style', []):
-                        genres.append(('discogs_style', style))
-            except Exception as e:
-                self.logger.error(f"Error con Discogs API: {str(e)}")
-
+            fetchers['discogs'] = self.discogs_genres
+        return fetchers
+
+    def _fetch_source_genres(self, source, fetcher, artist_name, track_name, mbid):
+        """
+        Géneros de una fuente; si falla o tarda más que su timeout, ninguno.
+        Tras GENRE_SOURCE_MAX_FAILURES fallos seguidos la fuente se da por
+        caída y no se le pregunta más en esta carga.
+        """
+        if self.genre_failures[source] >= GENRE_SOURCE_MAX_FAILURES:
+            return []
+        try:
+            genres = fetcher(artist_name, track_name, mbid, GENRE_SOURCES[source][1])
+        except Exception as e:
+            self.logger.error(f"Error con {source} para {artist_name} - {track_name}: {str(e)}")
+            with self.genre_lock:
+                self.genre_failures[source] += 1
+                if self.genre_failures[source] == GENRE_SOURCE_MAX_FAILURES:
+                    self.logger.warning(f"{source}: {GENRE_SOURCE_MAX_FAILURES} fallos seguidos, "
+                                        f"no se consultará más en esta carga")
+            return []
+        with self.genre_lock:
+            self.genre_failures[source] = 0
         return genres
 
+    def resolve_genres(self, keys):
+        """
+        Géneros de muchas canciones [(artista, canción, mbid)] a la vez.
+
+        Cada fuente tiene su propio pool de hilos y su presupuesto en
+        rate_limiter, así que las cuatro se consultan en paralelo y varias
+        canciones están en vuelo a la vez: el ritmo total lo marca la fuente
+        más lenta, no la suma de las cuatro. Una fuente que falla o pasa
+        de su timeout sólo deja sin sus géneros a esa canción.
+        Devuelve {clave: [(fuente, género)]} en el orden de siempre
+        (Last.fm, Spotify, MusicBrainz, Discogs).
+        """
+        for source, (workers, _) in GENRE_SOURCES.items():
+            if source not in self.genre_pools:
+                self.genre_pools[source] = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix=f'genres-{source}'
+                )
+
+        resolved = {}
+        for start in range(0, len(keys), GENRE_CHUNK_SIZE):
+            chunk = keys[start:start + GENRE_CHUNK_SIZE]
+            futures = {
+                key: [
+                    self.genre_pools[source].submit(self._fetch_source_genres, source, fetcher, *key)
+                    for source, fetcher in self.genre_fetchers(key[2]).items()
+                ]
+                for key in chunk
+            }
+            for key, source_futures in futures.items():
+                resolved[key] = [genre for future in source_futures for genre in future.result()]
+            if len(keys) > GENRE_CHUNK_SIZE:
+                self.logger.info(f"Géneros: {len(resolved)}/{len(keys)} canciones consultadas")
+        return resolved
+
+    def get_genres_from_apis(self, artist_name, track_name, mbid):
+        """Obtener géneros de todas las APIs disponibles"""
+        key = (artist_name, track_name, mbid)
+        return self.resolve_genres([key])[key]
+
+    def get_track_genres(self, artist_name, track_name, mbid):
+        """Géneros de una canción: los de enrich_genres o, si no estaba, de las APIs"""
+        key = (artist_name, track_name, mbid)
+        if key not in self.track_genres:
+            self.track_genres[key] = self.get_genres_from_apis(artist_name, track_name, mbid)
+        return self.track_genres[key]
+
+    def stored_genres(self, conn, artist_name, track_name, mbid):
+        """[(fuente, género)] que ya tiene la canción en track_genres (vacío si no tiene)"""
+        return conn.execute("""
+            SELECT DISTINCT gs.name, g.name
+            FROM track_genres tg
+            JOIN tracks t ON t.id = tg.track_id
+            JOIN artists a ON a.id = t.artist_id
+            JOIN genres g ON g.id = tg.genre_id
+            JOIN genre_sources gs ON gs.id = g.source_id
+            WHERE a.name = ? AND t.name = ? AND t.mbid IS ?
+            ORDER BY tg.rowid
+        """, (artist_name, track_name, mbid)).fetchall()
+
+    def enrich_genres(self, conn, data, checkpoint):
+        """
+        Resuelve los géneros de cada (artista, canción, mbid) distinto que
+        falta por cargar, una sola vez y antes de guardar las reproducciones.
+        Las canciones que ya tienen filas en track_genres no se consultan.
+        """
+        pending = {}
+        for username, tracks in data['users'].items():
+            if self.is_loaded(checkpoint, username):
+                continue
+            for track, _ in self.pending_plays(checkpoint, username, tracks):
+                pending.setdefault((track['artist']['name'], track['name'], track.get('mbid')), None)
+
+        stored = 0
+        to_fetch = []
+        for key in pending:
+            if key in self.track_genres:
+                continue
+            genres = self.stored_genres(conn, *key)
+            if genres:
+                self.track_genres[key] = genres
+                stored += 1
+            else:
+                to_fetch.append(key)
+
+        self.logger.info(
+            f"Géneros: {len(pending)} canciones distintas, {stored} ya en la base de datos, "
+            f"{len(to_fetch)} por consultar"
+        )
+        self.track_genres.update(self.resolve_genres(to_fetch))
+
     def parse_timestamp(self, timestamp):
         """Convertir timestamp a componentes de tiempo"""
         dt = datetime.fromtimestamp(timestamp)
@@ -190,8 +403,8 @@ class LastFMDatabaseLoader:
                     last_played = MAX(last_played, excluded.last_played)
             """, (user_id, genre_id, timestamp, timestamp))
 
-    def process_track(self, conn, track_data, user_id, timestamp):
-        """Procesar una pista y sus relaciones"""
+    def process_track(self, conn, track_data, user_id, timestamp, update_stats=True):
+        """Procesar una pista y sus relaciones (sin user_*_stats si update_stats=False)"""
         try:
             # Insertar artista
             artist_id = self.get_or_create_record(
@@ -239,7 +452,7 @@ class LastFMDatabaseLoader:
             )
 
             # Obtener y procesar géneros
-            genres = self.get_genres_from_apis(
+            genres = self.get_track_genres(
                 track_data['artist']['name'],
                 track_data['name'],
                 track_data.get('mbid')
@@ -275,7 +488,8 @@ class LastFMDatabaseLoader:
             ))
 
             # Actualizar estadísticas
-            self.update_user_stats(conn, user_id, track_id, artist_id, album_id, genre_ids, timestamp)
+            if update_stats:
+                self.update_user_stats(conn, user_id, track_id, artist_id, album_id, genre_ids, timestamp)
 
             return track_id
 
@@ -285,33 +499,278 @@ class LastFMDatabaseLoader:
 
     def get_source_id(self, conn, source_name):
         """Obtener ID de la fuente de géneros"""
+        cache = self.id_caches['genre_sources']
+        source_id = cache.get((source_name,))
+        if source_id is not None:
+            return source_id
+
         cursor = conn.execute(
             "SELECT id FROM genre_sources WHERE name = ?",
             (source_name,)
         )
         result = cursor.fetchone()
+        if result:
+            cache.put((source_name,), result[0])
         return result[0] if result else None
 
+    def _id_cache_key(self, table, search_params):
+        """(caché, clave) si la búsqueda se puede cachear; (None, None) si no"""
+        if ID_CACHE_KEYS.get(table) != tuple(search_params):
+            return None, None
+        return self.id_caches[table], tuple(search_params.values())
+
     def get_or_create_record(self, conn, table, search_params, insert_params=None):
         """Obtener o crear un registro en la base de datos"""
         if insert_params is None:
             insert_params = search_params
 
-        where_clause = ' AND '.join(f'{k} = ?' for k in search_params.keys())
+        cache, key = self._id_cache_key(table, search_params)
+        if cache is not None:
+            record_id = cache.get(key)
+            if record_id is not None:
+                return record_id
+
+        # IS en vez de =: una canción sin álbum (album_id NULL) también se encuentra
+        where_clause = ' AND '.join(f'{k} IS ?' for k in search_params.keys())
         select_query = f'SELECT id FROM {table} WHERE {where_clause}'
         
         cursor = conn.execute(select_query, list(search_params.values()))
         result = cursor.fetchone()
         
         if result:
-            return result[0]
-        
-        columns = ', '.join(insert_params.keys())
-        placeholders = ', '.join('?' * len(insert_params))
-        insert_query = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
-        
-        cursor = conn.execute(insert_query, list(insert_params.values()))
-        return cursor.lastrowid
+            record_id = result[0]
+        else:
+            columns = ', '.join(insert_params.keys())
+            placeholders = ', '.join('?' * len(insert_params))
+            insert_query = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+            
+            cursor = conn.execute(insert_query, list(insert_params.values()))
+            record_id = cursor.lastrowid
+
+        if cache is not None:
+            cache.put(key, record_id)
+        return record_id
+
+    def warm_id_caches(self, conn):
+        """Carga en las cachés los IDs más recientes de cada dimensión"""
+        for table, key_columns in ID_CACHE_KEYS.items():
+            cache = self.id_caches[table]
+            columns = ', '.join(key_columns)
+            rows = conn.execute(
+                f"SELECT MIN(id), {columns} FROM {table} "
+                f"GROUP BY {columns} ORDER BY MIN(id) DESC LIMIT ?",
+                (cache.maxsize,)
+            ).fetchall()
+            # Del más antiguo al más nuevo: los últimos quedan como recientes
+            for row in reversed(rows):
+                cache.put(tuple(row[1:]), row[0])
+
+    def reset_id_caches(self):
+        """Tras un rollback los IDs insertados en la transacción ya no existen"""
+        for cache in self.id_caches.values():
+            cache.clear()
+
+    def log_id_cache_stats(self):
+        for table, cache in self.id_caches.items():
+            stats = cache.stats()
+            if stats['hits'] or stats['misses']:
+                self.logger.info(
+                    f"Caché de IDs {table}: {stats['hit_rate']:.1%} aciertos "
+                    f"({stats['hits']}/{stats['hits'] + stats['misses']}, {stats['size']} en memoria)"
+                )
+
+    # Carga masiva (--bulk)
+
+    def bulk_get_or_create(self, conn, table, key_columns, records):
+        """
+        get_or_create_record para muchos registros a la vez.
+
+        records es {clave: insert_params}, con la clave en el orden de
+        key_columns. Las que están en la caché de IDs no tocan la BD; el
+        resto se inserta con un solo executemany si no existe y se resuelve
+        con una sola consulta (JOIN con una tabla temporal). Las claves se
+        comparan con IS, como en get_or_create_record. Devuelve {clave: id}.
+        """
+        cache = self.id_caches[table] if ID_CACHE_KEYS.get(table) == tuple(key_columns) else None
+        ids = {}
+        if cache is not None:
+            for key in records:
+                record_id = cache.get(key)
+                if record_id is not None:
+                    ids[key] = record_id
+            records = {key: params for key, params in records.items() if key not in ids}
+        if not records:
+            return ids
+        match = ' AND '.join(f't.{col} IS k.{col}' for col in key_columns)
+
+        columns = list(next(iter(records.values())).keys())
+        placeholders = ', '.join('?' * len(columns))
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) SELECT {placeholders} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE "
+            + ' AND '.join(f'{col} IS ?' for col in key_columns) + ")",
+            [[params[col] for col in columns] + list(key) for key, params in records.items()]
+        )
+
+        conn.execute("DROP TABLE IF EXISTS temp.bulk_keys")
+        conn.execute(f"CREATE TEMP TABLE bulk_keys ({', '.join(key_columns)})")
+        conn.executemany(
+            f"INSERT INTO temp.bulk_keys VALUES ({', '.join('?' * len(key_columns))})",
+            list(records)
+        )
+        key_select = ', '.join(f'k.{col}' for col in key_columns)
+        for row in conn.execute(
+            f"SELECT MIN(t.id), {key_select} FROM temp.bulk_keys k "
+            f"JOIN {table} t ON {match} GROUP BY {key_select}"
+        ):
+            key = tuple(row[1:])
+            ids[key] = row[0]
+            if cache is not None and None not in key:
+                cache.put(key, row[0])
+        return ids
+
+    def bulk_insert_plays(self, conn, user_id, plays, update_stats=True):
+        """
+        Inserta una tanda de reproducciones [(track_data, timestamp)] de un
+        usuario: dimensiones por conjuntos, user_plays con executemany y las
+        estadísticas sumadas antes de un solo UPSERT por fila (salvo con
+        update_stats=False). Devuelve el número de reproducciones guardadas.
+        """
+        artists = {}
+        for track_data, _ in plays:
+            artist = track_data['artist']
+            artists.setdefault((artist['name'],), {'name': artist['name'], 'mbid': artist['mbid']})
+        artist_ids = self.bulk_get_or_create(conn, 'artists', ('name',), artists)
+
+        albums = {}
+        for track_data, _ in plays:
+            album = track_data.get('album')
+            if album:
+                artist_id = artist_ids[(track_data['artist']['name'],)]
+                albums.setdefault((album['name'], artist_id), {
+                    'name': album['name'],
+                    'artist_id': artist_id,
+                    'mbid': album.get('mbid'),
+                    'image_url': album.get('image')
+                })
+        album_ids = self.bulk_get_or_create(conn, 'albums', ('name', 'artist_id'), albums)
+
+        def track_key(track_data):
+            artist_id = artist_ids[(track_data['artist']['name'],)]
+            album = track_data.get('album')
+            album_id = album_ids[(album['name'], artist_id)] if album else None
+            return track_data['name'], artist_id, album_id
+
+        tracks = {}
+        for track_data, _ in plays:
+            key = track_key(track_data)
+            tracks.setdefault(key, {
+                'name': track_data['name'],
+                'artist_id': key[1],
+                'album_id': key[2],
+                'mbid': track_data.get('mbid'),
+                'duration': track_data.get('duration'),
+                'url': track_data.get('url')
+            })
+        track_ids = self.bulk_get_or_create(conn, 'tracks', ('name', 'artist_id', 'album_id'), tracks)
+
+        # Géneros ya resueltos en enrich_genres
+        track_genres = {}
+        for track_data, _ in plays:
+            track_id = track_ids[track_key(track_data)]
+            if track_id not in track_genres:
+                track_genres[track_id] = [
+                    (genre_name, self.get_source_id(conn, source))
+                    for source, genre_name in self.get_track_genres(
+                        track_data['artist']['name'],
+                        track_data['name'],
+                        track_data.get('mbid')
+                    )
+                ]
+        genre_ids = self.bulk_get_or_create(conn, 'genres', ('name', 'source_id'), {
+            key: {'name': key[0], 'source_id': key[1]}
+            for genres in track_genres.values() for key in genres
+        })
+        track_genres = {
+            track_id: [genre_ids[key] for key in genres]
+            for track_id, genres in track_genres.items()
+        }
+        conn.executemany(
+            "INSERT OR IGNORE INTO track_genres (track_id, genre_id, confidence) VALUES (?, ?, 1.0)",
+            [(track_id, genre_id) for track_id, genres in track_genres.items() for genre_id in genres]
+        )
+
+        play_rows = []
+        stats = {table: {} for table in ('user_track_stats', 'user_artist_stats',
+                                         'user_album_stats', 'user_genre_stats')}
+
+        def count(table, item_id, timestamp):
+            entry = stats[table].get(item_id)
+            if entry is None:
+                stats[table][item_id] = [1, timestamp, timestamp]
+            else:
+                entry[0] += 1
+                entry[1] = min(entry[1], timestamp)
+                entry[2] = max(entry[2], timestamp)
+
+        for track_data, timestamp in plays:
+            _, artist_id, album_id = key = track_key(track_data)
+            track_id = track_ids[key]
+            time_data = self.parse_timestamp(timestamp)
+            play_rows.append((
+                user_id, track_id,
+                time_data['timestamp'], time_data['year'],
+                time_data['month'], time_data['day'],
+                time_data['hour']
+            ))
+            if not update_stats:
+                continue
+            count('user_track_stats', track_id, timestamp)
+            count('user_artist_stats', artist_id, timestamp)
+            if album_id:
+                count('user_album_stats', album_id, timestamp)
+            for genre_id in track_genres[track_id]:
+                count('user_genre_stats', genre_id, timestamp)
+
+        conn.executemany("""
+            INSERT INTO user_plays (
+                user_id, track_id, timestamp, year, month, day, hour
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, play_rows)
+
+        for table, id_column in (('user_track_stats', 'track_id'), ('user_artist_stats', 'artist_id'),
+                                 ('user_album_stats', 'album_id'), ('user_genre_stats', 'genre_id')):
+            if not stats[table]:
+                continue
+            conn.executemany(f"""
+                INSERT INTO {table} (user_id, {id_column}, play_count, first_played, last_played)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, {id_column}) DO UPDATE SET
+                    play_count = play_count + excluded.play_count,
+                    first_played = MIN(first_played, excluded.first_played),
+                    last_played = MAX(last_played, excluded.last_played)
+            """, [(user_id, item_id, *entry) for item_id, entry in stats[table].items()])
+
+        return len(play_rows)
+
+    def rebuild_user_stats(self, conn, user_ids):
+        """
+        Recalcula user_track/artist/album/genre_stats de los usuarios dados
+        a partir de todas sus filas de user_plays, con un GROUP BY por tabla.
+        Da lo mismo que los UPSERT por reproducción de update_user_stats.
+        """
+        conn.execute("DROP TABLE IF EXISTS temp.stats_users")
+        conn.execute("CREATE TEMP TABLE stats_users (user_id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO temp.stats_users VALUES (?)", [(user_id,) for user_id in user_ids])
+
+        for table, (id_column, select) in USER_STATS_ROLLUPS.items():
+            conn.execute(f"DELETE FROM {table} WHERE user_id IN (SELECT user_id FROM temp.stats_users)")
+            conn.execute(f"""
+                INSERT INTO {table} (user_id, {id_column}, play_count, first_played, last_played)
+                {select}
+            """)
+        conn.commit()
+        self.logger.info(f"Estadísticas recalculadas para {len(user_ids)} usuarios")
 
     def load_checkpoint(self):
         """Cargar el último checkpoint procesado"""
@@ -326,8 +785,41 @@ class LastFMDatabaseLoader:
         with open(self.checkpoint_path, 'w') as f:
             json.dump(checkpoint, f)
 
-    def process_json_file(self, json_path):
-        """Procesar archivo JSON y migrar datos"""
+    @staticmethod
+    def is_loaded(checkpoint, username):
+        """Los usuarios se cargan por orden de nombre: los anteriores a last_user ya están completos"""
+        return bool(checkpoint['last_user']) and username < checkpoint['last_user']
+
+    @staticmethod
+    def pending_plays(checkpoint, username, tracks):
+        """
+        (track, timestamp) que faltan por cargar de un usuario, ordenadas por
+        fecha. De last_user sólo falta lo posterior a last_timestamp, que se
+        guarda siempre después de un commit.
+        """
+        since = checkpoint['last_timestamp'] if username == checkpoint['last_user'] else None
+        plays = [
+            (track, timestamp)
+            for track in tracks
+            for timestamp in track['timestamps']
+            if since is None or timestamp > since
+        ]
+        plays.sort(key=lambda play: play[1])
+        return plays
+
+    def process_json_file(self, json_path, bulk=False, batch_size=5000, defer_stats=False):
+        """
+        Procesar archivo JSON y migrar datos.
+
+        Los usuarios se cargan por orden de nombre y sus reproducciones por
+        fecha; el checkpoint se guarda después de cada commit, así que al
+        reanudar se sigue justo donde se quedó.
+        Con bulk=True las reproducciones se guardan en tandas de batch_size
+        (bulk_insert_plays), cada una en su propia transacción y con el
+        checkpoint al final, en vez de fila a fila.
+        Con defer_stats=True no se tocan las tablas user_*_stats durante la
+        carga: se recalculan con rebuild_user_stats al terminar cada usuario.
+        """
         self.logger.info(f"Iniciando procesamiento de {json_path}")
         
         checkpoint = self.load_checkpoint()
@@ -338,9 +830,14 @@ class LastFMDatabaseLoader:
         with sqlite3.connect(self.db_path) as conn:
             conn.execute("PRAGMA foreign_keys = ON")
             conn.execute("PRAGMA journal_mode = WAL")
+            if bulk:
+                # Con WAL sólo se pierde la última tanda si se va la luz
+                conn.execute("PRAGMA synchronous = NORMAL")
+            self.warm_id_caches(conn)
+            self.enrich_genres(conn, data, checkpoint)
             
-            for username, tracks in data['users'].items():
-                if checkpoint['last_user'] and username <= checkpoint['last_user']:
+            for username, tracks in sorted(data['users'].items()):
+                if self.is_loaded(checkpoint, username):
                     continue
                 
                 self.logger.info(f"Procesando usuario: {username}")
@@ -351,43 +848,82 @@ class LastFMDatabaseLoader:
                         'users', 
                         {'username': username}
                     )
+                    plays = self.pending_plays(checkpoint, username, tracks)
                     
-                    for track in tracks:
-                        for timestamp in track['timestamps']:
-                            if checkpoint['last_timestamp'] and timestamp <= checkpoint['last_timestamp']:
-                                continue
-                            
-                            self.process_track(conn, track, user_id, timestamp)
-                            self.save_checkpoint(username, timestamp)
-                    
-                    conn.commit()
+                    if bulk:
+                        self.bulk_load_user(conn, username, user_id, plays, batch_size,
+                                            update_stats=not defer_stats)
+                    else:
+                        for track, timestamp in plays:
+                            self.process_track(conn, track, user_id, timestamp, update_stats=not defer_stats)
+                        
+                        conn.commit()
+                        if plays:
+                            self.save_checkpoint(username, plays[-1][1])
+
+                    # En cuanto el usuario está guardado: si se corta más
+                    # adelante, al reanudar ya no se vuelve a pasar por él
+                    if defer_stats:
+                        self.rebuild_user_stats(conn, {user_id})
                     
                 except Exception as e:
                     self.logger.error(f"Error procesando usuario {username}: {str(e)}")
                     conn.rollback()
+                    self.reset_id_caches()
                     continue
+
         
+        self.log_id_cache_stats()
         self.logger.info("Migración completada exitosamente")
 
+    def bulk_load_user(self, conn, username, user_id, plays, batch_size, update_stats=True):
+        """
+        Guarda las reproducciones (ordenadas por fecha) de un usuario en
+        tandas, con commit y checkpoint por tanda. Una tanda nunca parte un
+        mismo timestamp: al reanudar se salta todo lo que sea <= checkpoint.
+        """
+        loaded = 0
+        start = 0
+        while start < len(plays):
+            end = min(start + batch_size, len(plays))
+            while end < len(plays) and plays[end][1] == plays[end - 1][1]:
+                end += 1
+            batch = plays[start:end]
+            loaded += self.bulk_insert_plays(conn, user_id, batch, update_stats)
+            conn.commit()
+            self.save_checkpoint(username, batch[-1][1])
+            self.logger.info(f"{username}: {loaded}/{len(plays)} reproducciones guardadas")
+            start = end
+
 def main():
-    if len(sys.argv) != 3:
-        print("Uso: python script.py <database_path> <json_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Carga en SQLite el JSON que genera lastfm_data.py')
+    parser.add_argument('database_path', help='Base de datos SQLite')
+    parser.add_argument('json_path', help='JSON de lastfm_data.py')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Guardar las reproducciones en tandas con executemany')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='Reproducciones por transacción con --bulk')
+    parser.add_argument('--defer-stats', action='store_true',
+                        help='No actualizar user_*_stats por reproducción: recalcularlas desde '
+                             'user_plays al terminar cada usuario (con --bulk apenas ayuda: '
+                             'ya se suman por tanda)')
+    parser.add_argument('--id-cache-size', type=int, default=DEFAULT_ID_CACHE_SIZE,
+                        help='IDs en memoria por tabla (artistas, álbumes, canciones, géneros)')
+    args = parser.parse_args()
 
-    database_path = sys.argv[1]
-    json_path = sys.argv[2]
     schema_path = "schema.sql"  # El archivo schema.sql debe estar en el mismo directorio
     checkpoint_path = "checkpoint.json"
 
     # Verificar si la base de datos está inicializada
-    loader = LastFMDatabaseLoader(database_path, checkpoint_path, schema_path)
+    loader = LastFMDatabaseLoader(args.database_path, checkpoint_path, schema_path, args.id_cache_size)
 
-    if not Path(database_path).exists():
+    if not Path(args.database_path).exists():
         loader.logger.info("La base de datos no existe. Creándola...")
         loader.setup_database()
 
     # Procesar el archivo JSON
-    loader.process_json_file(json_path)
+    loader.process_json_file(args.json_path, bulk=args.bulk, batch_size=args.batch_size,
+                             defer_stats=args.defer_stats)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
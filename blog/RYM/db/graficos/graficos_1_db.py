@@ -1,25 +1,31 @@
 import sqlite3
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from pathlib import Path
 import argparse
 from typing import Tuple, List
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from scrobble_archive import ScrobbleArchive
 
 class MusicVisualization:
-    def __init__(self, db_path: str, output_path: str):
+    def __init__(self, db_path: str, output_path: str, archive_path: str = None):
         self.conn = sqlite3.connect(db_path)
+        # Archivo columnar de scrobbles: si está, los periodos se cortan en
+        # memoria en vez de consultar la base de datos
+        self.archive = ScrobbleArchive(archive_path) if archive_path else None
         self.output_path = Path(output_path)
         self.output_path.mkdir(parents=True, exist_ok=True)
         
         plt.style.use('seaborn-v0_8-deep')
         sns.set_palette("husl")
     
-    def get_date_filter(self, period: str, date: str) -> Tuple[str, tuple]:
+    def get_date_range(self, period: str, date: str) -> Tuple[int, int]:
         """
-        Genera la cláusula WHERE SQL basada en el período y fecha
+        Timestamps [inicio, fin) del período
         Params:
             period: 'semanal', 'mensual', o 'anual'
             date: número de semana (1-53), mes (1-12), o año (YYYY)
@@ -32,10 +38,6 @@ class MusicVisualization:
             week = int(date)
             start_date = datetime.strptime(f'{year}-W{week}-1', '%Y-W%W-%w')
             end_date = start_date + timedelta(days=7)
-            return """
-                datetime(timestamp, 'unixepoch') >= datetime(?, 'start of day')
-                AND datetime(timestamp, 'unixepoch') < datetime(?, 'start of day')
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
             
         elif period == "mensual":
             # Convertir número de mes a rango de fechas
@@ -46,48 +48,73 @@ class MusicVisualization:
                 end_date = datetime(year + 1, 1, 1)
             else:
                 end_date = datetime(year, month + 1, 1)
-            return """
-                datetime(timestamp, 'unixepoch') >= datetime(?, 'start of day')
-                AND datetime(timestamp, 'unixepoch') < datetime(?, 'start of day')
-            """, (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
             
         else:  # anual
             year = int(date)
-            start_date = f"{year}-01-01"
-            end_date = f"{year + 1}-01-01"
-            return """
-                datetime(timestamp, 'unixepoch') >= datetime(?, 'start of day')
-                AND datetime(timestamp, 'unixepoch') < datetime(?, 'start of day')
-            """, (start_date, end_date)
+            start_date = datetime(year, 1, 1)
+            end_date = datetime(year + 1, 1, 1)
+        
+        # Días naturales en UTC, igual que datetime(?, 'start of day') en SQLite
+        return (
+            int(start_date.replace(tzinfo=timezone.utc).timestamp()),
+            int(end_date.replace(tzinfo=timezone.utc).timestamp())
+        )
+
+    def get_date_filter(self, period: str, date: str) -> Tuple[str, tuple]:
+        """
+        Genera la cláusula WHERE SQL basada en el período y fecha
+        """
+        # Comparación directa con el entero: puede usar el índice de timestamp
+        return "timestamp >= ? AND timestamp < ?", self.get_date_range(period, date)
+
+    def _archive_pairs(self, period: str, date: str) -> pd.DataFrame:
+        """Canciones distintas en común por par de usuarios, desde el archivo columnar"""
+        start, end = self.get_date_range(period, date)
+        pairs = self.archive.pair_coincidences('song', start, end - 1)
+        return pd.DataFrame(pairs, columns=['user1', 'user2', 'coincidences'])
+
+    def _archive_top_common(self, period: str, date: str, limit: int = 15) -> pd.DataFrame:
+        """Canciones escuchadas por más usuarios, desde el archivo columnar"""
+        start, end = self.get_date_range(period, date)
+        shared = self.archive.shared_counts('song', start, end - 1)
+        # Mismo orden que la consulta SQL: usuarios y, a igualdad, nombre
+        items = sorted(
+            ((f"{artist} - {song}", users) for (song, artist), users in shared),
+            key=lambda item: (-item[1], item[0])
+        )
+        return pd.DataFrame(items[:limit], columns=['item', 'user_count'])
 
     def user_coincidences(self, period: str, date: str) -> None:
         """
         Genera gráfico de barras de coincidencias entre usuarios
         """
-        where_clause, params = self.get_date_filter(period, date)
+        if self.archive is not None:
+            df = self._archive_pairs(period, date)
+        else:
+            where_clause, params = self.get_date_filter(period, date)
         
-        query = f"""
-        WITH user_songs AS (
-            SELECT DISTINCT username, song_name, artist_name
-            FROM songs s
-            WHERE {where_clause}
-        ),
-        user_pairs AS (
-            SELECT 
-                a.username as user1,
-                b.username as user2,
-                COUNT(*) as coincidences
-            FROM user_songs a
-            JOIN user_songs b ON a.song_name = b.song_name 
-                AND a.artist_name = b.artist_name
-                AND a.username < b.username
-            GROUP BY a.username, b.username
-        )
-        SELECT * FROM user_pairs
-        ORDER BY coincidences DESC
-        """
+            query = f"""
+            WITH user_songs AS (
+                SELECT DISTINCT username, song_name, artist_name
+                FROM songs s
+                WHERE {where_clause}
+            ),
+            user_pairs AS (
+                SELECT 
+                    a.username as user1,
+                    b.username as user2,
+                    COUNT(*) as coincidences
+                FROM user_songs a
+                JOIN user_songs b ON a.song_name = b.song_name 
+                    AND a.artist_name = b.artist_name
+                    AND a.username < b.username
+                GROUP BY a.username, b.username
+            )
+            SELECT * FROM user_pairs
+            ORDER BY coincidences DESC
+            """
         
-        df = pd.read_sql_query(query, self.conn, params=params)
+            df = pd.read_sql_query(query, self.conn, params=params)
         
         if df.empty:
             print("No hay coincidencias para este período")
@@ -125,30 +152,33 @@ class MusicVisualization:
         """
         Genera un heatmap de coincidencias de álbumes entre usuarios
         """
-        where_clause, params = self.get_date_filter(period, date)
+        if self.archive is not None:
+            df = self._archive_pairs(period, date).rename(columns={'coincidences': 'count'})
+        else:
+            where_clause, params = self.get_date_filter(period, date)
         
-        query = f"""
-        WITH common_albums AS (
-            SELECT DISTINCT 
-                a.username as user1,
-                b.username as user2,
-                a.song_name,
-                a.artist_name
-            FROM songs a
-            JOIN songs b ON a.song_name = b.song_name 
-                AND a.artist_name = b.artist_name
-                AND a.username < b.username
-            WHERE ({where_clause})
-        )
-        SELECT 
-            user1, user2,
-            GROUP_CONCAT(artist_name || ' - ' || song_name) as songs,
-            COUNT(*) as count
-        FROM common_albums
-        GROUP BY user1, user2
-        """
+            query = f"""
+            WITH common_albums AS (
+                SELECT DISTINCT 
+                    a.username as user1,
+                    b.username as user2,
+                    a.song_name,
+                    a.artist_name
+                FROM songs a
+                JOIN songs b ON a.song_name = b.song_name 
+                    AND a.artist_name = b.artist_name
+                    AND a.username < b.username
+                WHERE ({where_clause})
+            )
+            SELECT 
+                user1, user2,
+                GROUP_CONCAT(artist_name || ' - ' || song_name) as songs,
+                COUNT(*) as count
+            FROM common_albums
+            GROUP BY user1, user2
+            """
         
-        df = pd.read_sql_query(query, self.conn, params=params)
+            df = pd.read_sql_query(query, self.conn, params=params)
         
         if df.empty:
             print("No hay coincidencias de álbumes para este período")
@@ -179,28 +209,31 @@ class MusicVisualization:
         """
         Genera gráfico horizontal de los elementos más coincididos entre todos los usuarios
         """
-        where_clause, params = self.get_date_filter(period, date)
+        if self.archive is not None:
+            df = self._archive_top_common(period, date)
+        else:
+            where_clause, params = self.get_date_filter(period, date)
         
-        query = f"""
-        WITH user_counts AS (
+            query = f"""
+            WITH user_counts AS (
+                SELECT 
+                    artist_name,
+                    song_name,
+                    COUNT(DISTINCT username) as user_count
+                FROM songs s
+                WHERE {where_clause}
+                GROUP BY artist_name, song_name
+                HAVING user_count > 1
+            )
             SELECT 
-                artist_name,
-                song_name,
-                COUNT(DISTINCT username) as user_count
-            FROM songs s
-            WHERE {where_clause}
-            GROUP BY artist_name, song_name
-            HAVING user_count > 1
-        )
-        SELECT 
-            artist_name || ' - ' || song_name as item,
-            user_count
-        FROM user_counts
-        ORDER BY user_count DESC
-        LIMIT 15
-        """
+                artist_name || ' - ' || song_name as item,
+                user_count
+            FROM user_counts
+            ORDER BY user_count DESC, item
+            LIMIT 15
+            """
         
-        df = pd.read_sql_query(query, self.conn, params=params)
+            df = pd.read_sql_query(query, self.conn, params=params)
         
         if df.empty:
             print("No hay elementos comunes para este período")
@@ -248,10 +281,11 @@ def main():
     parser.add_argument('db_path', help='Ruta a la base de datos SQLite')
     parser.add_argument('period', choices=['semanal', 'mensual', 'anual'], help='Período de tiempo')
     parser.add_argument('date', help='Fecha específica (número de semana 1-53, mes 1-12, o año YYYY)')
+    parser.add_argument('--archive', help='Directorio del archivo columnar de scrobbles (en vez de consultar la base de datos)')
     
     args = parser.parse_args()
     
-    viz = MusicVisualization(args.db_path, args.output_path)
+    viz = MusicVisualization(args.db_path, args.output_path, args.archive)
     viz.generate_all_visualizations(args.period, args.date)
 
 if __name__ == "__main__":
@@ -1,70 +1,74 @@
 import argparse
 import json
-import requests
 from datetime import datetime, timedelta
-import time
 import sys
 import logging
+from pathlib import Path
 from typing import Dict, List, Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from api_cache import ApiCache, MISSING, DAY
+from lastfm_client import LastFMClient
+from recent_tracks import iter_pages, PageFetchError
+from retry_policy import STATS as RETRY_STATS, LastFMError
+from topk import SpaceSaving, top_k
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Last.fm error 6: "Track not found" / parámetros inválidos
+LASTFM_ERROR_NOT_FOUND = 6
+
 class LastFMStats:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, page_workers: int = 4, track_cache: Optional[ApiCache] = None):
         self.api_key = api_key
-        self.base_url = "http://ws.audioscrobbler.com/2.0/"
-        
-    def _make_request(self, method: str, params: Dict, max_retries: int = 3) -> Dict:
-        """Make a request to Last.fm API with robust error handling"""
-        params.update({
-            'method': method,
-            'api_key': self.api_key,
-            'format': 'json'
-        })
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(self.base_url, params=params, timeout=10)
-                
-                # Log raw response for debugging
-                logger.debug(f"Raw response: {response.text[:500]}...")
-                
-                # Check for HTTP errors
-                response.raise_for_status()
-                
-                # Check for Last.fm API errors
-                json_response = response.json()
-                if 'error' in json_response:
-                    logger.error(f"Last.fm API Error: {json_response}")
-                    return {}
-                
-                time.sleep(0.1)  # Rate limiting
-                return json_response
-            
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Request error (attempt {attempt+1}/{max_retries}): {e}")
-                time.sleep(0.1)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error (attempt {attempt+1}/{max_retries}): {e}")
-                logger.error(f"Response content: {response.text}")
-                time.sleep(0.1)
+        self.page_workers = page_workers
+        # Sesión compartida por los hilos del paginador (keep-alive, gzip, 5 peticiones/s)
+        self.client = LastFMClient(api_key, timeout=10)
+        # Caché en disco de track.getInfo (None = preguntar siempre a la API)
+        self.track_cache = track_cache
         
-        logger.error("Max retries reached. Failed to fetch data.")
-        return {}
+    def _make_request(self, method: str, params: Dict, return_errors: bool = False) -> Dict:
+        """Make a request to Last.fm API with error-code aware retries
+
+        Transient errors (29, 8, 16, network, 5xx) are retried with backoff
+        inside LastFMClient.call. With return_errors=True, Last.fm error
+        payloads ({'error': N, ...}) are returned instead of {} so the
+        caller can tell them apart.
+        """
+        try:
+            return self.client.call(method, params)
+        except LastFMError as e:
+            logger.error(f"Last.fm request failed ({method}): {e}")
+            if return_errors and e.code is not None:
+                return {'error': e.code, 'message': e.message}
+            return {}
     
     def get_track_info(self, artist: str, track: str) -> Dict:
         """Get detailed track information including duration, mbid, and genres"""
+        cache_key = ApiCache.make_key(artist, track)
+        if self.track_cache:
+            cached = self.track_cache.get(cache_key)
+            if cached is MISSING:
+                return {}
+            if cached is not None:
+                return cached
+
         try:
             params = {
                 'artist': artist,
                 'track': track
             }
-            track_info = self._make_request('track.getInfo', params)
+            track_info = self._make_request('track.getInfo', params, return_errors=True)
+
+            if track_info.get('error') == LASTFM_ERROR_NOT_FOUND:
+                if self.track_cache:
+                    self.track_cache.set_missing(cache_key)
+                return {}
 
-            if not track_info:
+            if not track_info or 'error' in track_info:
                 return {}
 
             # Extraer géneros si existen
@@ -74,6 +78,8 @@ class LastFMStats:
             # Agregar géneros a la respuesta
             track_info["track"]["genres"] = genres
 
+            if self.track_cache:
+                self.track_cache.set(cache_key, track_info)
             return track_info
         except Exception as e:
             logger.warning(f"Could not fetch track info for {artist} - {track}: {e}")
@@ -81,9 +87,7 @@ class LastFMStats:
     
     def get_user_tracks(self, username: str, start_time: int, end_time: int) -> List[Dict]:
         """Get user's scrobbled tracks within a time period"""
-        tracks = []
-        page = 1
-        while True:
+        def fetch_page(page: int) -> Dict:
             params = {
                 'user': username,
                 'from': start_time,
@@ -91,57 +95,87 @@ class LastFMStats:
                 'page': page,
                 'limit': 200
             }
-            
-            try:
-                response = self._make_request('user.getRecentTracks', params)
-                
-                if not response or 'recenttracks' not in response or 'track' not in response['recenttracks']:
-                    logger.warning(f"No tracks found for {username} in this period")
-                    break
-                
-                current_tracks = response['recenttracks']['track']
+            return self._make_request('user.getRecentTracks', params)
+
+        tracks = []
+        try:
+            # _make_request ya reintenta cada página, el paginador no repite
+            for response in iter_pages(fetch_page, workers=self.page_workers, max_retries=1):
+                current_tracks = response['recenttracks'].get('track', [])
                 if not current_tracks:
                     break
-                
                 tracks.extend(current_tracks)
-                
-                # Check if there are more pages
-                total_pages = int(response['recenttracks']['@attr'].get('totalPages', 1))
-                if page >= total_pages:
-                    break
-                
-                page += 1
-                
-            except Exception as e:
-                logger.error(f"Error fetching tracks for {username}: {e}")
-                break
+        except PageFetchError as e:
+            logger.warning(f"No tracks found for {username} in this period ({e})")
+        except Exception as e:
+            logger.error(f"Error fetching tracks for {username}: {e}")
         
         return tracks
 
-    def process_tracks(self, tracks: List[Dict], period_type: str) -> List[Dict]:
-        """Process tracks and add additional information"""
+    @staticmethod
+    def _track_key(track: Dict) -> Optional[str]:
+        """Clave artista-canción del scrobble, o None si hay que saltarlo"""
+        # Skip now playing tracks
+        if '@attr' in track and 'nowplaying' in track['@attr']:
+            return None
+        # Ensure required keys exist
+        if not all(key in track for key in ['artist', 'name', 'date', 'album']):
+            return None
+        return f"{track['artist']['#text']}-{track['name']}"
+
+    def _select_keys(self, tracks: List[Dict], top: int, approximate: bool) -> set:
+        """
+        Claves de las `top` canciones más escuchadas: heap sobre los
+        contadores exactos, o Space-Saving con memoria fija si approximate
+        """
+        counter = SpaceSaving(capacity=max(top * 10, 100)) if approximate else {}
+        for track in tracks:
+            try:
+                key = self._track_key(track)
+            except (KeyError, TypeError):
+                continue
+            if key is None:
+                continue
+            if approximate:
+                counter.add(key)
+            else:
+                counter[key] = counter.get(key, 0) + 1
+        selected = counter.top(top) if approximate else top_k(counter, top)
+        return {entry[0] for entry in selected}
+
+    def process_tracks(self, tracks: List[Dict], period_type: str, top: Optional[int] = None,
+                       approximate: bool = False, track_infos: Optional[Dict] = None) -> List[Dict]:
+        """
+        Process tracks and add additional information.
+
+        With `top`, only the `top` most played tracks are kept (and only
+        those are looked up with track.getInfo). `track_infos` is a
+        {key: track.getInfo} dict shared between calls so each track is
+        looked up once.
+        """
         if not tracks:
             logger.warning("No tracks to process")
             return []
         
+        selected = self._select_keys(tracks, top, approximate) if top is not None else None
         track_stats = {}
         
         for track in tracks:
             try:
-                # Skip now playing tracks
-                if '@attr' in track and 'nowplaying' in track['@attr']:
-                    continue
-                
-                # Ensure required keys exist
-                if not all(key in track for key in ['artist', 'name', 'date', 'album']):
+                key = self._track_key(track)
+                if key is None or (selected is not None and key not in selected):
                     continue
                 
-                key = f"{track['artist']['#text']}-{track['name']}"
                 timestamp = int(track['date']['uts'])
                 
                 if key not in track_stats:
                     # Try to get track information
-                    track_info = self.get_track_info(track['artist']['#text'], track['name'])
+                    if track_infos is not None and key in track_infos:
+                        track_info = track_infos[key]
+                    else:
+                        track_info = self.get_track_info(track['artist']['#text'], track['name'])
+                        if track_infos is not None:
+                            track_infos[key] = track_info
                     
                     track_stats[key] = {
                         'name': track['name'],
@@ -167,85 +201,113 @@ class LastFMStats:
             except Exception as e:
                 logger.warning(f"Error processing track: {e}")
         
-        # Convert to list and add ranks
-        result = list(track_stats.values())
-        result.sort(key=lambda x: x['plays'], reverse=True)
+        # Convert to list and add ranks. With `top` there are at most `top`
+        # entries here, recounted exactly (Space-Saving only picked them)
+        result = sorted(track_stats.values(), key=lambda x: x['plays'], reverse=True)
         for i, track in enumerate(result):
             track['rank'] = i + 1
         
         return result
 
-def create_weekly_stats(api_key: str, usernames: List[str], year: int, week: int):
-    stats = LastFMStats(api_key)
-    result = {'period': 'weekly', 'year': year, 'week': week, 'users': {}}
-    
-    # Calculate week start and end timestamps
+def week_bounds(year: int, week: int):
+    """(start, end) timestamps of a %W week"""
     start_date = datetime.strptime(f'{year}-W{week}-1', '%Y-W%W-%w')
     end_date = start_date + timedelta(days=7)
-    
-    for username in usernames:
-        logger.info(f"Processing weekly stats for {username}")
-        tracks = stats.get_user_tracks(
-            username,
-            int(start_date.timestamp()),
-            int(end_date.timestamp())
-        )
-        result['users'][username] = stats.process_tracks(tracks, 'weekly')
-    
-    return result
+    return int(start_date.timestamp()), int(end_date.timestamp())
 
-def create_monthly_stats(api_key: str, usernames: List[str], year: int, month: int):
-    stats = LastFMStats(api_key)
-    result = {'period': 'monthly', 'year': year, 'month': month, 'users': {}}
-    
-    # Calculate month start and end timestamps
+def month_bounds(year: int, month: int):
     start_date = datetime(year, month, 1)
     if month == 12:
         end_date = datetime(year + 1, 1, 1)
     else:
         end_date = datetime(year, month + 1, 1)
-    
-    for username in usernames:
-        logger.info(f"Processing monthly stats for {username}")
-        tracks = stats.get_user_tracks(
-            username,
-            int(start_date.timestamp()),
-            int(end_date.timestamp())
-        )
-        result['users'][username] = stats.process_tracks(tracks, 'monthly')
-    
-    return result
+    return int(start_date.timestamp()), int(end_date.timestamp())
+
+def year_bounds(year: int):
+    return int(datetime(year, 1, 1).timestamp()), int(datetime(year + 1, 1, 1).timestamp())
+
+def period_bounds(period: Dict):
+    """(start, end) of a result header like {'period': 'weekly', 'year': 2024, 'week': 3}"""
+    if period['period'] == 'weekly':
+        return week_bounds(period['year'], period['week'])
+    if period['period'] == 'monthly':
+        return month_bounds(period['year'], period['month'])
+    return year_bounds(period['year'])
+
+def create_period_stats(api_key: str, usernames: List[str], periods: List[Dict],
+                        track_cache: Optional[ApiCache] = None, top: Optional[int] = None,
+                        approximate: bool = False) -> List[Dict]:
+    """
+    Stats for several periods at once, one result per header in `periods`.
+
+    Each user's scrobbles are fetched once for the widest window and
+    bucketed into every period they fall in (Last.fm's from/to are both
+    inclusive, so are the buckets). track.getInfo is asked once per track.
+    """
+    stats = LastFMStats(api_key, track_cache=track_cache)
+    results = [{**period, 'users': {}} for period in periods]
+    bounds = [period_bounds(period) for period in periods]
+    start_time = min(start for start, _ in bounds)
+    end_time = max(end for _, end in bounds)
+    track_infos = {}
 
-def create_yearly_stats(api_key: str, usernames: List[str], year: int):
-    stats = LastFMStats(api_key)
-    result = {'period': 'yearly', 'year': year, 'users': {}}
-    
-    # Calculate year start and end timestamps
-    start_date = datetime(year, 1, 1)
-    end_date = datetime(year + 1, 1, 1)
-    
     for username in usernames:
-        logger.info(f"Processing yearly stats for {username}")
-        tracks = stats.get_user_tracks(
-            username,
-            int(start_date.timestamp()),
-            int(end_date.timestamp())
-        )
-        result['users'][username] = stats.process_tracks(tracks, 'yearly')
-    
-    return result
+        logger.info(f"Processing {', '.join(p['period'] for p in periods)} stats for {username}")
+        tracks = stats.get_user_tracks(username, start_time, end_time)
+
+        buckets = [[] for _ in periods]
+        for track in tracks:
+            try:
+                timestamp = int(track['date']['uts'])
+            except (KeyError, TypeError, ValueError):
+                # Now playing: process_tracks would skip it anyway
+                continue
+            for bucket, (start, end) in zip(buckets, bounds):
+                if start <= timestamp <= end:
+                    bucket.append(track)
+
+        for result, bucket in zip(results, buckets):
+            result['users'][username] = stats.process_tracks(
+                bucket, result['period'], top, approximate, track_infos
+            )
+
+    return results
+
+def create_weekly_stats(api_key: str, usernames: List[str], year: int, week: int,
+                       track_cache: Optional[ApiCache] = None, top: Optional[int] = None,
+                       approximate: bool = False):
+    return create_period_stats(api_key, usernames, [{'period': 'weekly', 'year': year, 'week': week}],
+                               track_cache, top, approximate)[0]
+
+def create_monthly_stats(api_key: str, usernames: List[str], year: int, month: int,
+                       track_cache: Optional[ApiCache] = None, top: Optional[int] = None,
+                       approximate: bool = False):
+    return create_period_stats(api_key, usernames, [{'period': 'monthly', 'year': year, 'month': month}],
+                               track_cache, top, approximate)[0]
+
+def create_yearly_stats(api_key: str, usernames: List[str], year: int,
+                       track_cache: Optional[ApiCache] = None, top: Optional[int] = None,
+                       approximate: bool = False):
+    return create_period_stats(api_key, usernames, [{'period': 'yearly', 'year': year}],
+                               track_cache, top, approximate)[0]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate Last.fm statistics')
     parser.add_argument('--api-key', required=True, help='Last.fm API key')
     parser.add_argument('--users', required=True, nargs='+', help='List of Last.fm usernames')
-    parser.add_argument('--period', required=True, choices=['weekly', 'monthly', 'yearly'], 
-                      help='Statistics period')
+    parser.add_argument('--period', required=True, choices=['weekly', 'monthly', 'yearly', 'all'], 
+                      help='Statistics period ("all": weekly, monthly and yearly from one fetch per user, '
+                           'written to <output>_weekly.json, <output>_monthly.json and <output>_yearly.json)')
     parser.add_argument('--year', required=True, type=int, help='Year')
     parser.add_argument('--month', type=int, help='Month (1-12, required for monthly stats)')
     parser.add_argument('--week', type=int, help='Week number (1-52, required for weekly stats)')
     parser.add_argument('--output', required=True, help='Output JSON file path')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the on-disk track.getInfo cache')
+    parser.add_argument('--top', type=int, help='Keep only the N most played tracks per user')
+    parser.add_argument('--approximate-top', action='store_true',
+                        help='Pick the --top tracks with Space-Saving (bounded memory) instead of exact counts')
+    parser.add_argument('--cache-ttl-days', type=int, default=30, help='Days before a cached track.getInfo expires')
     
     args = parser.parse_args()
     
@@ -253,25 +315,54 @@ if __name__ == "__main__":
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
-    if args.period == 'weekly' and args.week is None:
+    if args.period in ('weekly', 'all') and args.week is None:
         parser.error('Week number is required for weekly statistics')
-    if args.period == 'monthly' and args.month is None:
+    if args.period in ('monthly', 'all') and args.month is None:
         parser.error('Month is required for monthly statistics')
+    if args.approximate_top and args.top is None:
+        parser.error('--approximate-top needs --top')
+    
+    track_cache = None
+    if not args.no_cache:
+        track_cache = ApiCache('track.getInfo', ttl=args.cache_ttl_days * DAY)
     
     try:
         # Generate statistics based on period
-        if args.period == 'weekly':
-            result = create_weekly_stats(args.api_key, args.users, args.year, args.week)
+        if args.period == 'all':
+            periods = [
+                {'period': 'weekly', 'year': args.year, 'week': args.week},
+                {'period': 'monthly', 'year': args.year, 'month': args.month},
+                {'period': 'yearly', 'year': args.year},
+            ]
+            results = create_period_stats(args.api_key, args.users, periods, track_cache,
+                                          args.top, args.approximate_top)
+            output = Path(args.output)
+            outputs = {
+                output.with_name(f"{output.stem}_{result['period']}{output.suffix or '.json'}"): result
+                for result in results
+            }
+        elif args.period == 'weekly':
+            result = create_weekly_stats(args.api_key, args.users, args.year, args.week, track_cache,
+                                         args.top, args.approximate_top)
         elif args.period == 'monthly':
-            result = create_monthly_stats(args.api_key, args.users, args.year, args.month)
+            result = create_monthly_stats(args.api_key, args.users, args.year, args.month, track_cache,
+                                          args.top, args.approximate_top)
         else:  # yearly
-            result = create_yearly_stats(args.api_key, args.users, args.year)
+            result = create_yearly_stats(args.api_key, args.users, args.year, track_cache,
+                                         args.top, args.approximate_top)
+        if args.period != 'all':
+            outputs = {args.output: result}
         
-        # Save results to JSON file
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        if track_cache:
+            logger.info(f"track.getInfo cache: {track_cache.stats()}")
+        logger.info(f"Last.fm retries: {RETRY_STATS.summary()}")
         
-        logger.info(f"Statistics saved to {args.output}")
+        # Save results to JSON file
+        for output, result in outputs.items():
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            
+            logger.info(f"Statistics saved to {output}")
     
     except Exception as e:
         logger.error(f"An error occurred: {e}")
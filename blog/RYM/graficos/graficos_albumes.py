@@ -21,6 +21,11 @@ import sys
 import os
 import numpy as np
 from procesar_visualizaciones import procesar_visualizaciones
+from pathlib import Path
+
+# Módulos compartidos de blog/RYM
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from weekly_dataset import is_dataset, load_index
 
 
 
@@ -52,6 +57,15 @@ def extraer_tablas_canciones(md_text):
     print(f"Se extrajeron {len(albums_data)} álbumes.")
     return albums_data
 
+# 2b. Cargar los álbumes compartidos desde el dataset de blog_rym.py
+def cargar_albumes_dataset(dataset_path):
+    albums_data = [
+        (album, artista, list(usuarios.items()))
+        for album, artista, usuarios in load_index(dataset_path).shared_albums()
+    ]
+    print(f"Se cargaron {len(albums_data)} álbumes.")
+    return albums_data
+
 # 3. Guardar JSON
 def guardar_json(data, filename):
     with open(filename, 'w', encoding='utf-8') as json_file:
@@ -566,8 +580,12 @@ if __name__ == "__main__":
     print(f"Carpeta de salida: {carpeta}")
     print(f"Destino markdown: {destino_md}")
     
-    markdown_text = leer_markdown(archivo_md)
-    albums_data = extraer_tablas_canciones(markdown_text)
+    # .jsonl/.parquet de blog_rym.py; los markdown antiguos se siguen parseando
+    if is_dataset(archivo_md):
+        albums_data = cargar_albumes_dataset(archivo_md)
+    else:
+        markdown_text = leer_markdown(archivo_md)
+        albums_data = extraer_tablas_canciones(markdown_text)
     procesar_datos(albums_data, carpeta)
     
     # Llamada a la función para generar el markdown
@@ -12,6 +12,12 @@ import unicodedata
 from matplotlib.colors import LinearSegmentedColormap
 import seaborn as sns
 from procesar_visualizaciones import procesar_visualizaciones
+from pathlib import Path
+
+# Módulos compartidos de blog/RYM
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from scrobble_aggregator import UserBitmaskIndex
+from weekly_dataset import is_dataset, load_index
 
 
 def leer_markdown(file_path):
@@ -37,6 +43,16 @@ def extraer_tabla_artistas(md_text):
     
     print(f"Se extrajeron {len(artists_data)} entradas de artistas.")
     return artists_data
+def cargar_artistas_dataset(dataset_path):
+    """Una fila (usuario, artista) por cada usuario de cada artista compartido"""
+    artists_data = [
+        (usuario, artista)
+        for artista, usuarios in load_index(dataset_path).shared_artists()
+        for usuario in usuarios
+    ]
+    print(f"Se cargaron {len(artists_data)} entradas de artistas.")
+    return artists_data
+
 def configurar_fuentes():
     """
     Configura las fuentes del sistema según el sistema operativo,
@@ -372,16 +388,18 @@ def plot_usuarios_artistas_heatmap(df, carpeta, colors, max_usuarios_por_heatmap
         
         plt.figure(figsize=(14, 10))
         
-        # Crear matriz de coincidencias
-        pivot = pd.crosstab(df_subset['Usuario'], df_subset['Artista'])
+        # Máscara de usuarios por artista: comunes y unión por par con popcount
+        index = UserBitmaskIndex(usuarios_subset)
+        for usuario, artista in zip(df_subset['Usuario'], df_subset['Artista']):
+            index.add('artists', artista, usuario)
         
-        # Calcular coincidencias y normalizar
+        # Calcular coincidencias y normalizar (índice de Jaccard)
         coincidencias = np.zeros((len(usuarios_subset), len(usuarios_subset)))
-        for j in range(len(usuarios_subset)):
-            for k in range(len(usuarios_subset)):
-                artistas_comunes = (pivot.iloc[j] & pivot.iloc[k]).sum()
-                total_artistas = (pivot.iloc[j] | pivot.iloc[k]).sum()
-                coincidencias[j,k] = artistas_comunes / total_artistas if total_artistas > 0 else 0
+        for (usuario1, usuario2), (comunes, total) in index.pair_overlaps('artists', usuarios_subset).items():
+            j, k = index.bits[usuario1], index.bits[usuario2]
+            coincidencias[j, k] = coincidencias[k, j] = comunes / total if total > 0 else 0
+        for j, usuario in enumerate(usuarios_subset):
+            coincidencias[j, j] = 1 if index.overlap('artists', usuario, usuario) else 0
         
         # Crear heatmap
         sns.heatmap(coincidencias, 
@@ -481,8 +499,12 @@ if __name__ == "__main__":
     print(f"Carpeta de salida: {carpeta}")
     print(f"Destino markdown: {destino_md}")
     
-    markdown_text = leer_markdown(archivo_md)
-    artists_data = extraer_tabla_artistas(markdown_text)
+    # .jsonl/.parquet de blog_rym.py; los markdown antiguos se siguen parseando
+    if is_dataset(archivo_md):
+        artists_data = cargar_artistas_dataset(archivo_md)
+    else:
+        markdown_text = leer_markdown(archivo_md)
+        artists_data = extraer_tabla_artistas(markdown_text)
     procesar_datos(artists_data, carpeta)
     generar_markdown_imagenes(carpeta, destino_md)
     print("Proceso completado.")
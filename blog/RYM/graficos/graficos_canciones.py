@@ -21,6 +21,11 @@ import sys
 import os
 import numpy as np
 from procesar_visualizaciones import procesar_visualizaciones
+from pathlib import Path
+
+# Módulos compartidos de blog/RYM
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from weekly_dataset import is_dataset, load_index
 
 
 # 1. Leer el archivo Markdown
@@ -52,6 +57,15 @@ def extraer_tablas_canciones(md_text):
     print(f"Se extrajeron {len(canciones_data)} canciones.")
     return canciones_data
 
+# 2b. Cargar las canciones compartidas desde el dataset de blog_rym.py
+def cargar_canciones_dataset(dataset_path):
+    canciones_data = [
+        (cancion, artista, album, list(usuarios.items()))
+        for (cancion, artista, album), usuarios in load_index(dataset_path).shared_tracks()
+    ]
+    print(f"Se cargaron {len(canciones_data)} canciones.")
+    return canciones_data
+
 # 3. Guardar JSON
 def guardar_json(data, filename):
     with open(filename, 'w', encoding='utf-8') as json_file:
@@ -438,8 +452,12 @@ if __name__ == "__main__":
     
     destino_md = sys.argv[3]                            # archivo markdown, debe estar en content/graficos/FECHa/{CANCION|ALBUM|ARTISTA}
     
-    markdown_text = leer_markdown(archivo_md)
-    canciones_data = extraer_tablas_canciones(markdown_text)
+    # .jsonl/.parquet de blog_rym.py; los markdown antiguos se siguen parseando
+    if is_dataset(archivo_md):
+        canciones_data = cargar_canciones_dataset(archivo_md)
+    else:
+        markdown_text = leer_markdown(archivo_md)
+        canciones_data = extraer_tablas_canciones(markdown_text)
     procesar_datos(canciones_data, carpeta)
     
     # Después de crear tu DataFrame
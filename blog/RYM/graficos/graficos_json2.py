@@ -182,6 +182,27 @@ class LastFMVisualizer:
         plt.title('Comparación de Obsesiones Musicales (Z-Score)')
         self.save_plot('obsession_comparison')
 
+    def plot_binges(self, obsessions_file: Path, window: str = 'week'):
+        """Obsesiones de todo el historial (binge_detector) a lo largo del tiempo"""
+        df = pd.read_csv(obsessions_file)
+        df = df[df['ventana'] == window]
+        if df.empty:
+            print("No se encontraron obsesiones en el historial")
+            return
+        df['periodo'] = pd.to_datetime(df['periodo'])
+
+        plt.figure(figsize=(20, 8))
+        sns.scatterplot(data=df,
+                        x='periodo',
+                        y='usuario',
+                        size='z',
+                        hue='tipo',
+                        sizes=(20, 400),
+                        alpha=0.6)
+        plt.title(f'Obsesiones por {"semana" if window == "week" else "mes"} (Z-Score sobre el historial)')
+        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        self.save_plot(f'binges_{window}')
+
 
     def plot_top_shared_artists(self, coincidences_file: Path, top_n: int = 30):
         """Visualiza los artistas más compartidos entre usuarios con desglose por usuario"""
@@ -236,7 +257,7 @@ def main():
     parser.add_argument('--output-dir', type=str, default='visualizations',
                        help='Directorio para guardar las visualizaciones')
     parser.add_argument('--plots', nargs='+', choices=[
-        'similarity', 'genres', 'trends', 'shared', 'obsessions'
+        'similarity', 'genres', 'trends', 'shared', 'obsessions', 'binges'
     ], help='Gráficos a generar')
     
     args = parser.parse_args()
@@ -279,6 +300,14 @@ def main():
                 visualizer.plot_obsession_comparison(year_files)
             else:
                 print("No se encontraron archivos de datos anuales")
+
+        if 'binges' in args.plots:
+            obsessions_files = list(data_dir.glob('**/obsessions_*_history.csv'))
+            if obsessions_files:
+                for window in ('week', 'month'):
+                    visualizer.plot_binges(obsessions_files[0], window)
+            else:
+                print("No se encontró archivo de obsesiones del historial")
                 
     except Exception as e:
         print(f"Error durante la visualización: {e}")
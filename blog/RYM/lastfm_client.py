@@ -0,0 +1,105 @@
+"""
+Cliente HTTP reutilizable para la API de Last.fm.
+
+Una sola `requests.Session` por cliente: conexiones keep-alive en un pool
+de tamaño configurable, timeouts por defecto y respuestas comprimidas.
+Todos los scripts que hablan con Last.fm deberían pasar por aquí en vez de
+llamar a `requests.get` directamente.
+
+`call()` añade reintentos según el código de error (ver retry_policy).
+"""
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api_cache import ApiCache, DAY
+from rate_limiter import get_limiter
+from retry_policy import LastFMError, RetryPolicy, USER_STATE_METHODS
+
+# Se puede apuntar a otro servidor (p. ej. uno local para pruebas)
+DEFAULT_BASE_URL = os.getenv('LASTFM_API_URL', "http://ws.audioscrobbler.com/2.0/")
+DEFAULT_POOL_SIZE = int(os.getenv('LASTFM_POOL_SIZE', 16))
+# (conexión, lectura) en segundos
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class LastFMClient:
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, rate_limiter=None, retry_policy=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        # Por defecto, el cubo de Last.fm compartido con el resto de procesos
+        self.rate_limiter = rate_limiter or get_limiter('lastfm')
+        # Perfiles privados / inexistentes se recuerdan un día
+        self.retry_policy = retry_policy or RetryPolicy(error_cache=ApiCache('lastfm.errors', ttl=DAY))
+
+        self.session = requests.Session()
+        # pool_maxsize debe cubrir los hilos que comparten el cliente
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': 'hugo_scripts-rym/1.0',
+        })
+
+    def request(self, method, params=None, timeout=None):
+        """
+        Hace una llamada GET a la API y devuelve la `requests.Response`.
+
+        Añade method, api_key y format=json a los params. El manejo de
+        errores (raise_for_status, reintentos...) queda en manos de quien
+        llama, como hasta ahora.
+        """
+        query = dict(params or {})
+        query.update({
+            'method': method,
+            'api_key': self.api_key,
+            'format': 'json',
+        })
+        self.rate_limiter.wait()
+        return self.session.get(self.base_url, params=query, timeout=timeout or self.timeout)
+
+    def _call_once(self, method, params, timeout):
+        try:
+            response = self.request(method, params, timeout)
+        except requests.exceptions.RequestException as e:
+            raise LastFMError(None, f"{type(e).__name__}: {e}", transient=True)
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        # Last.fm manda el error en el JSON, a veces con HTTP 200 y a veces con 4xx/5xx
+        if isinstance(data, dict) and 'error' in data:
+            raise LastFMError.from_payload(data, method)
+        if response.status_code >= 400:
+            transient = response.status_code >= 500 or response.status_code == 429
+            raise LastFMError(None, f"HTTP {response.status_code}", transient=transient)
+        if data is None:
+            raise LastFMError(None, "Respuesta sin JSON válido", transient=True)
+        return data
+
+    def call(self, method, params=None, timeout=None):
+        """
+        Como request() pero devuelve el JSON ya comprobado.
+
+        Reintenta los errores transitorios con backoff y lanza
+        retry_policy.LastFMError si no hay forma de conseguir la respuesta.
+        """
+        user_key = None
+        # Sólo estos métodos dicen de verdad si el perfil es privado o no existe
+        if method.lower() in USER_STATE_METHODS and params:
+            username = params.get('user') or params.get('username')
+            if username:
+                user_key = ApiCache.make_key('user', username)
+        return self.retry_policy.run(
+            lambda: self._call_once(method, params, timeout),
+            user_key=user_key,
+            description=method,
+        )
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,135 @@
+"""
+Limitador de peticiones para las APIs que usan los scripts.
+
+TokenBucket es un cubo de tokens cuyo estado vive en SQLite, de modo que
+todos los procesos que lanzan get-links.sh o blog_rym_padre.sh comparten
+el mismo presupuesto por servicio.
+
+Uso habitual: `get_limiter('lastfm').wait()` antes de cada petición.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Presupuesto por servicio: (peticiones, periodo en segundos)
+SERVICE_BUDGETS = {
+    'lastfm': (5, 1.0),          # 5/s por IP (Last.fm API ToS)
+    'musicbrainz': (1, 1.0),     # 1/s por IP
+    'discogs': (60, 60.0),       # 60/min autenticado
+    'spotify': (10, 1.0),        # Spotify no publica cifra; margen conservador
+}
+
+
+def _parse_budgets(spec):
+    """'lastfm=100/1,discogs=60/60' -> {'lastfm': (100, 1.0), 'discogs': (60, 60.0)}"""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        service, budget = item.split('=')
+        max_calls, period = budget.split('/')
+        budgets[service.strip()] = (int(max_calls), float(period))
+    return budgets
+
+
+# Para pruebas y benchmarks contra un servidor local
+SERVICE_BUDGETS.update(_parse_budgets(os.getenv('RYM_RATE_LIMITS', '')))
+
+DEFAULT_STATE_PATH = os.getenv(
+    'RYM_RATE_LIMIT_DB',
+    os.path.join(tempfile.gettempdir(), 'hugo_scripts_rate_limits.db')
+)
+
+
+class TokenBucket:
+    """
+    Cubo de tokens compartido entre procesos.
+
+    Se rellena a `max_calls / period` tokens por segundo hasta un máximo de
+    `max_calls`. El estado (tokens, última actualización) se guarda en una
+    tabla SQLite y cada lectura-modificación va en una transacción
+    BEGIN IMMEDIATE, que SQLite serializa entre procesos.
+    """
+    def __init__(self, service, max_calls, period, state_path=DEFAULT_STATE_PATH):
+        self.service = service
+        self.capacity = float(max_calls)
+        self.rate = max_calls / period
+        self.state_path = state_path
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                service TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def _connection(self):
+        # sqlite3 no deja compartir conexiones entre hilos: una por hilo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.state_path, timeout=30, isolation_level=None)
+            # El estado del cubo es efímero: sin fsync por token
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+        return conn
+
+    def _try_acquire(self):
+        """Intenta coger un token; devuelve 0 si lo consigue o los segundos a esperar"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE service = ?", (self.service,)
+            ).fetchone()
+            if row is None:
+                tokens = self.capacity
+            else:
+                tokens, updated = row
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (service, tokens, updated) VALUES (?, ?, ?)",
+                (self.service, tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def wait(self):
+        """Bloquea hasta conseguir un token del servicio"""
+        while True:
+            sleep_time = self._try_acquire()
+            if sleep_time <= 0:
+                return
+            if sleep_time > 1:
+                print(f"⏳ Límite de {self.service} alcanzado. Esperando {sleep_time:.2f} segundos",
+                      file=sys.stderr)
+            time.sleep(sleep_time)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(service, state_path=DEFAULT_STATE_PATH):
+    """Devuelve el TokenBucket del servicio (uno por proceso, estado compartido)"""
+    with _limiters_lock:
+        key = (service, state_path)
+        if key not in _limiters:
+            max_calls, period = SERVICE_BUDGETS[service]
+            _limiters[key] = TokenBucket(service, max_calls, period, state_path)
+        return _limiters[key]
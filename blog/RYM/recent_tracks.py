@@ -0,0 +1,87 @@
+"""
+Paginación concurrente de user.getrecenttracks.
+
+La primera página ya trae `totalPages`, así que el resto se pide en
+paralelo. Las páginas se devuelven en orden y sólo se reintentan las
+que fallan.
+"""
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PageFetchError(Exception):
+    """No se pudo obtener una página tras agotar los reintentos"""
+    def __init__(self, page, data=None):
+        super().__init__(f"No se pudo obtener la página {page}")
+        self.page = page
+        self.data = data
+
+
+def _is_valid_page(data):
+    return bool(data) and 'recenttracks' in data
+
+
+def _total_pages(data):
+    return int(data['recenttracks'].get('@attr', {}).get('totalPages', 1) or 1)
+
+
+def _fetch_with_retries(fetch_page, page, max_retries, rate_limiter):
+    data = None
+    for attempt in range(max_retries):
+        if rate_limiter:
+            rate_limiter.wait()
+        data = fetch_page(page)
+        if _is_valid_page(data):
+            return data
+        print(f"⚠️ Página {page} fallida (intento {attempt + 1}/{max_retries})", file=sys.stderr)
+    raise PageFetchError(page, data)
+
+
+def iter_pages(fetch_page, workers=4, max_retries=3, rate_limiter=None):
+    """
+    Genera las respuestas de cada página en orden (1, 2, ..., totalPages).
+
+    fetch_page(page) debe devolver el JSON de la API o None si falla.
+    Si se pasa rate_limiter, se llama a su wait() antes de cada petición;
+    si fetch_page ya limita por su cuenta, no hace falta.
+    Lanza PageFetchError si una página no se consigue tras max_retries.
+    """
+    first = _fetch_with_retries(fetch_page, 1, max_retries, rate_limiter)
+    yield first
+
+    total_pages = _total_pages(first)
+    if total_pages <= 1:
+        return
+
+    def fetch_once(page):
+        if rate_limiter:
+            rate_limiter.wait()
+        return fetch_page(page)
+
+    workers = max(1, workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # Como mucho 2 páginas por hilo en vuelo: las respuestas no se acumulan
+    # en memoria si el consumidor va más lento que la red
+    in_flight = deque()
+    next_page = 2
+    try:
+        while in_flight or next_page <= total_pages:
+            while next_page <= total_pages and len(in_flight) < workers * 2:
+                in_flight.append((next_page, executor.submit(fetch_once, next_page)))
+                next_page += 1
+
+            page, future = in_flight.popleft()
+            data = future.result()
+            if not _is_valid_page(data):
+                data = _fetch_with_retries(fetch_page, page, max(max_retries - 1, 1), rate_limiter)
+            yield data
+    finally:
+        # Si el consumidor corta antes (o falla una página) no seguimos pidiendo
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_tracks(fetch_page, **kwargs):
+    """Igual que iter_pages pero devolviendo los tracks uno a uno"""
+    for data in iter_pages(fetch_page, **kwargs):
+        yield from data['recenttracks'].get('track', [])
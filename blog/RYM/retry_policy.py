@@ -0,0 +1,178 @@
+"""
+Reintentos de las llamadas a Last.fm según el código de error.
+
+- Transitorios (29 límite de peticiones, 8 fallo del backend, 11 servicio
+  caído, 16 error temporal, HTTP 5xx/429, red, JSON roto): se reintentan
+  con backoff exponencial y jitter, hasta un número de intentos y un
+  plazo total.
+- Permanentes (17 perfil privado, 6 no existe, parámetros inválidos...):
+  fallan a la primera. Los que dicen algo del usuario (17, o 6 con
+  "not found", en user.getinfo / user.getrecenttracks) se guardan en
+  caché para no volver a preguntar por ese usuario.
+
+STATS acumula reintentos, fallos y tiempo perdido de todo el proceso.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# https://www.last.fm/api/errorcodes
+RATE_LIMITED = 29
+TRANSIENT_CODES = {8, 11, 16, RATE_LIMITED}
+PRIVATE_PROFILE = 17
+NOT_FOUND = 6
+# Métodos cuyo 6/17 habla del usuario; en los demás (p. ej. los charts
+# semanales) el 6 también puede ser "parámetros inválidos"
+USER_STATE_METHODS = {'user.getinfo', 'user.getrecenttracks'}
+
+
+class LastFMError(Exception):
+    """
+    Llamada fallida: error de la API (code) o de red/HTTP (code None).
+    `transient` indica si merecía la pena reintentar.
+    """
+    def __init__(self, code, message, transient=False, cached=False, method=None):
+        super().__init__(f"Last.fm error {code}: {message}" if code is not None else message)
+        self.code = code
+        self.message = message
+        self.transient = transient
+        self.cached = cached
+        self.method = method
+
+    @property
+    def label(self):
+        """Clave para los contadores: el código o 'http' si no hubo respuesta de la API"""
+        return self.code if self.code is not None else 'http'
+
+    @property
+    def about_user(self):
+        """True si el error dice que el perfil es privado o no existe"""
+        if (self.method or '').lower() not in USER_STATE_METHODS:
+            return False
+        if self.code == PRIVATE_PROFILE:
+            return True
+        return self.code == NOT_FOUND and 'not found' in (self.message or '').lower()
+
+    @classmethod
+    def from_payload(cls, data, method=None):
+        code = data.get('error')
+        return cls(code, data.get('message', ''), transient=code in TRANSIENT_CODES, method=method)
+
+
+class RetryStats:
+    """Contadores compartidos entre hilos"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.retries = 0
+            self.failures = 0
+            self.permanent = 0
+            self.cached = 0
+            self.wasted_seconds = 0.0
+            self.codes = Counter()
+
+    def record(self, code=None, **deltas):
+        with self._lock:
+            if code is not None:
+                self.codes[code] += 1
+            for name, value in deltas.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'permanent': self.permanent,
+                'cached': self.cached,
+                'wasted_seconds': round(self.wasted_seconds, 2),
+                'codes': dict(self.codes),
+            }
+
+
+STATS = RetryStats()
+
+
+class RetryPolicy:
+    """
+    Ejecuta una llamada con reintentos.
+
+    El retardo del intento n es base_delay * 2**(n-1) (tope max_delay), la
+    mitad fija y la otra mitad aleatoria para que los hilos no reintenten a
+    la vez. Con error 29 el retardo se multiplica por rate_limit_factor.
+    Nunca se espera más allá de `deadline` segundos desde la primera llamada.
+    """
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=30.0, deadline=120.0,
+                 rate_limit_factor=4, error_cache=None, stats=STATS):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.rate_limit_factor = rate_limit_factor
+        # ApiCache opcional para los errores permanentes de usuario
+        self.error_cache = error_cache
+        self.stats = stats
+
+    def _delay(self, attempt, error):
+        delay = self.base_delay * 2 ** (attempt - 1)
+        if error.code == RATE_LIMITED:
+            delay *= self.rate_limit_factor
+        delay = min(delay, self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _cached_error(self, user_key):
+        if self.error_cache is None or user_key is None:
+            return None
+        cached = self.error_cache.get(user_key)
+        if not cached:
+            return None
+        return LastFMError(cached['code'], cached['message'], cached=True, method=cached.get('method'))
+
+    def _remember(self, user_key, error):
+        if self.error_cache is not None and user_key is not None and error.about_user:
+            self.error_cache.set(user_key, {'code': error.code, 'message': error.message, 'method': error.method})
+
+    def run(self, call, user_key=None, description=''):
+        """
+        Devuelve call() o lanza LastFMError.
+
+        call() debe lanzar LastFMError con `transient` bien puesto.
+        user_key identifica al usuario para la caché de errores permanentes.
+        """
+        cached = self._cached_error(user_key)
+        if cached is not None:
+            self.stats.record(cached=1, code=cached.label)
+            raise cached
+
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_start = time.monotonic()
+            self.stats.record(calls=1)
+            try:
+                return call()
+            except LastFMError as error:
+                wasted = time.monotonic() - attempt_start
+                if not error.transient:
+                    self.stats.record(permanent=1, wasted_seconds=wasted, code=error.label)
+                    self._remember(user_key, error)
+                    raise
+
+                delay = self._delay(attempt, error)
+                elapsed = time.monotonic() - start
+                if attempt >= self.max_attempts or elapsed + delay > self.deadline:
+                    self.stats.record(failures=1, wasted_seconds=wasted, code=error.label)
+                    raise
+
+                print(f"⏳ {description or 'Last.fm'}: {error} — reintento {attempt}/{self.max_attempts - 1} "
+                      f"en {delay:.1f}s", file=sys.stderr)
+                self.stats.record(retries=1, wasted_seconds=wasted + delay, code=error.label)
+                time.sleep(delay)
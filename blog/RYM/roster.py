@@ -0,0 +1,159 @@
+"""
+Estado de cada usuario de la lista del blog.
+
+Guarda en SQLite, por usuario, si el perfil está bien, es privado, no
+existe o no tiene ningún scrobble, y cuándo se comprobó. Los perfiles
+muertos se saltan hasta que caduca su plazo de recomprobación, en vez de
+descubrirlo otra vez paginando en cada ejecución.
+
+Si se le pasa fetch_info, filter() pide además user.getinfo de cada
+usuario: el total de escuchas se pasa a ScrobbleStore.sync, que no
+descarga nada si no ha cambiado desde la última sincronización.
+"""
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from retry_policy import LastFMError, NOT_FOUND, PRIVATE_PROFILE
+
+DEFAULT_DB_PATH = os.getenv(
+    'RYM_ROSTER_DB',
+    str(Path(__file__).resolve().parent / 'roster.db')
+)
+DAY = 24 * 60 * 60
+
+OK = 'ok'
+PRIVATE = 'private'
+MISSING = 'not_found'
+EMPTY = 'empty'
+
+# Cuánto se fía uno de cada estado antes de volver a preguntar
+RECHECK_AFTER = {
+    PRIVATE: 7 * DAY,
+    MISSING: 30 * DAY,
+    EMPTY: 1 * DAY,
+}
+
+ERROR_STATUS = {
+    PRIVATE_PROFILE: PRIVATE,
+    NOT_FOUND: MISSING,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster (
+    username TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    checked_at INTEGER NOT NULL,
+    playcount INTEGER,
+    message TEXT
+);
+"""
+
+
+class Roster:
+    def __init__(self, db_path=DEFAULT_DB_PATH, recheck_after=RECHECK_AFTER):
+        self.db_path = db_path
+        self.recheck_after = recheck_after
+        # Total de escuchas de la última comprobación, por usuario
+        self.playcounts = {}
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def status(self, username):
+        """Fila guardada del usuario (status, checked_at, playcount, message) o None"""
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM roster WHERE username = ?", (username,)).fetchone()
+
+    def mark(self, username, status, playcount=None, message=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO roster (username, status, checked_at, playcount, message) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (username, status, int(time.time()), playcount, message)
+            )
+
+    def record_error(self, username, error):
+        """
+        Guarda el estado que implica un LastFMError; devuelve ese estado o
+        None si no dice nada del usuario. Sólo cuentan los errores de
+        user.getinfo / user.getrecenttracks: el 6 de un chart semanal puede
+        ser "parámetros inválidos" con un usuario que existe.
+        """
+        if not error.about_user:
+            return None
+        status = ERROR_STATUS.get(error.code)
+        if status is not None:
+            self.mark(username, status, message=error.message)
+        return status
+
+    def is_skipped(self, username):
+        """Estado por el que hay que saltarse al usuario, o None si hay que consultarlo"""
+        row = self.status(username)
+        if row is None or row['status'] == OK:
+            return None
+        recheck_after = self.recheck_after.get(row['status'], 0)
+        if time.time() - row['checked_at'] >= recheck_after:
+            return None
+        return row['status']
+
+    def check(self, username, fetch_info):
+        """
+        Comprueba el perfil con fetch_info(username) -> JSON de user.getinfo
+        y devuelve el estado nuevo (None si un error transitorio no dejó saberlo).
+        El total de escuchas queda en self.playcounts.
+        """
+        try:
+            info = fetch_info(username)
+        except LastFMError as e:
+            status = self.record_error(username, e)
+            if status is None:
+                print(f"⚠️ {username}: no se pudo comprobar el perfil ({e})", file=sys.stderr)
+            return status
+
+        playcount = int(info.get('user', {}).get('playcount', 0) or 0)
+        status = OK if playcount else EMPTY
+        self.mark(username, status, playcount)
+        self.playcounts[username] = playcount
+        return status
+
+    def filter(self, usernames, fetch_info=None, workers=1):
+        """
+        Usuarios que hay que consultar, en el mismo orden.
+
+        Sin fetch_info sólo se descartan los que tienen un estado muerto
+        vigente. Con fetch_info se comprueba además cada perfil con
+        user.getinfo, `workers` a la vez.
+        """
+        def current_status(username):
+            status = self.is_skipped(username)
+            if status is None and fetch_info is not None:
+                status = self.check(username, fetch_info)
+            return status
+
+        if workers > 1 and fetch_info is not None:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                statuses = list(executor.map(current_status, usernames))
+        else:
+            statuses = [current_status(username) for username in usernames]
+
+        active = []
+        for username, status in zip(usernames, statuses):
+            if status not in (None, OK):
+                print(f"⏭️ {username}: {status}, se omite", file=sys.stderr)
+                continue
+            active.append(username)
+        return active
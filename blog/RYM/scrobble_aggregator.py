@@ -0,0 +1,261 @@
+"""
+Agregador en streaming de scrobbles.
+
+Consume (canción, artista, álbum) según van llegando las páginas y sólo
+guarda contadores por elemento distinto, no la lista de scrobbles. Los
+nombres se internan en IDs enteros, así que cada canción ocupa una tupla
+de tres enteros en vez de tres cadenas repetidas por cada escucha.
+"""
+from collections import defaultdict
+from itertools import combinations
+
+
+class Interner:
+    """Asigna un ID entero estable a cada cadena distinta"""
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def __call__(self, value):
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def __getitem__(self, value_id):
+        return self.values[value_id]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ScrobbleAggregator:
+    def __init__(self):
+        self.names = Interner()
+        # Contadores por clave de IDs; los dict conservan el orden de aparición
+        self.track_counts = {}     # (track_id, artist_id, album_id) -> escuchas
+        self.album_counts = {}     # (album_id, artist_id) -> escuchas
+        self.artist_counts = {}    # artist_id -> escuchas
+        self.total = 0
+
+    def add(self, track_name, artist_name, album_name):
+        intern = self.names
+        track_id = intern(track_name)
+        artist_id = intern(artist_name)
+        album_id = intern(album_name)
+
+        key = (track_id, artist_id, album_id)
+        self.track_counts[key] = self.track_counts.get(key, 0) + 1
+        key = (album_id, artist_id)
+        self.album_counts[key] = self.album_counts.get(key, 0) + 1
+        self.artist_counts[artist_id] = self.artist_counts.get(artist_id, 0) + 1
+        self.total += 1
+
+    def consume(self, scrobbles):
+        """Añade un iterable de (canción, artista, álbum); devuelve el total acumulado"""
+        for track_name, artist_name, album_name in scrobbles:
+            self.add(track_name, artist_name, album_name)
+        return self.total
+
+    def tracks(self):
+        """{(canción, artista, álbum): escuchas}"""
+        names = self.names
+        return {
+            (names[t], names[a], names[al]): plays
+            for (t, a, al), plays in self.track_counts.items()
+        }
+
+    def albums(self):
+        """{álbum: {artista: escuchas}}"""
+        names = self.names
+        albums = defaultdict(dict)
+        for (album_id, artist_id), plays in self.album_counts.items():
+            albums[names[album_id]][names[artist_id]] = plays
+        return albums
+
+    def artists(self):
+        """{artista: escuchas}"""
+        names = self.names
+        return {names[a]: plays for a, plays in self.artist_counts.items()}
+
+
+class CoincidenceIndex:
+    """
+    Índice invertido elemento -> {usuario: escuchas}.
+
+    Se rellena con una sola pasada por los contadores de cada usuario; las
+    tablas de coincidencias salen después de filtrar el índice, sin
+    recorrer todos los elementos por cada usuario.
+    """
+    def __init__(self):
+        self.tracks = {}          # (canción, artista, álbum) -> {usuario: escuchas}
+        self.albums = {}          # álbum -> {usuario: escuchas}
+        self.album_artists = {}   # álbum -> {artista: escuchas}
+        self.artists = {}         # artista -> {usuario: escuchas}
+
+    def add_user(self, user, tracks, albums, artists):
+        """Añade los contadores de un usuario tal y como los devuelve ScrobbleAggregator"""
+        for track, plays in tracks.items():
+            self.tracks.setdefault(track, {})[user] = plays
+
+        for album, album_artists in albums.items():
+            self.albums.setdefault(album, {})[user] = sum(album_artists.values())
+            artist_plays = self.album_artists.setdefault(album, {})
+            for artist, plays in album_artists.items():
+                artist_plays[artist] = artist_plays.get(artist, 0) + plays
+
+        for artist, plays in artists.items():
+            self.artists.setdefault(artist, {})[user] = plays
+
+    @staticmethod
+    def _shared(index, min_users):
+        # Orden estable: a igualdad de usuarios, por orden de aparición
+        shared = [(item, users) for item, users in index.items() if len(users) >= min_users]
+        shared.sort(key=lambda x: len(x[1]), reverse=True)
+        return shared
+
+    def shared_tracks(self, min_users=2):
+        """[((canción, artista, álbum), {usuario: escuchas})] de más a menos usuarios"""
+        return self._shared(self.tracks, min_users)
+
+    def shared_albums(self, min_users=2):
+        """[(álbum, artista, {usuario: escuchas})]; el artista es el más escuchado en ese álbum"""
+        return [
+            (album, max(self.album_artists[album].items(), key=lambda x: x[1])[0], users)
+            for album, users in self._shared(self.albums, min_users)
+        ]
+
+    def shared_artists(self, min_users=2):
+        """[(artista, {usuario: escuchas})] de más a menos usuarios"""
+        return self._shared(self.artists, min_users)
+
+
+class UserBitmaskIndex:
+    """
+    Índice elemento -> máscara de 64 bits con los usuarios que lo escuchan.
+
+    Cada usuario es un bit, así que "quién comparte X", "elementos de al
+    menos k usuarios" o "cuántos elementos tienen en común A y B" son
+    operaciones &, | y popcount sobre enteros, sin recorrer conjuntos. Para
+    los solapes por pares se guarda además la traspuesta: por usuario, un
+    entero con un bit por elemento.
+    """
+    MAX_USERS = 64
+
+    def __init__(self, users=()):
+        self.users = []           # bit -> usuario
+        self.bits = {}            # usuario -> bit
+        self.masks = {}           # tipo -> {elemento: máscara de usuarios}
+        self.plays = {}           # tipo -> {elemento: {usuario: escuchas}}
+        self._user_items = {}     # tipo -> [máscara de elementos por usuario], se calcula al consultar
+        for user in users:
+            self.user_bit(user)
+
+    def user_bit(self, user):
+        bit = self.bits.get(user)
+        if bit is None:
+            if len(self.users) >= self.MAX_USERS:
+                raise ValueError(f"UserBitmaskIndex admite como mucho {self.MAX_USERS} usuarios")
+            bit = self.bits[user] = len(self.users)
+            self.users.append(user)
+        return bit
+
+    def mask(self, users):
+        """Máscara de un iterable de usuarios (se ignoran los que no están en el índice)"""
+        mask = 0
+        for user in users:
+            bit = self.bits.get(user)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def users_in(self, mask):
+        return [user for bit, user in enumerate(self.users) if mask >> bit & 1]
+
+    def add(self, kind, item, user, plays=1):
+        bit = self.user_bit(user)
+        masks = self.masks.setdefault(kind, {})
+        masks[item] = masks.get(item, 0) | 1 << bit
+        item_plays = self.plays.setdefault(kind, {}).setdefault(item, {})
+        item_plays[user] = item_plays.get(user, 0) + plays
+        self._user_items.pop(kind, None)
+
+    def add_user(self, user, tracks, albums, artists):
+        """Mismos contadores que CoincidenceIndex.add_user; los álbumes se indexan por nombre"""
+        for track, plays in tracks.items():
+            self.add('tracks', track, user, plays)
+        for album, album_artists in albums.items():
+            self.add('albums', album, user, sum(album_artists.values()))
+        for artist, plays in artists.items():
+            self.add('artists', artist, user, plays)
+
+    def who(self, kind, item):
+        """Usuarios que escuchan `item`"""
+        return self.users_in(self.masks.get(kind, {}).get(item, 0))
+
+    def shared(self, kind, min_users=2, among=None):
+        """
+        [(elemento, máscara)] escuchados por al menos min_users usuarios de
+        `among` (todos si es None), de más a menos usuarios
+        """
+        subset = self.mask(among) if among is not None else (1 << len(self.users)) - 1
+        shared = []
+        for item, mask in self.masks.get(kind, {}).items():
+            mask &= subset
+            if mask.bit_count() >= min_users:
+                shared.append((item, mask))
+        shared.sort(key=lambda x: x[1].bit_count(), reverse=True)
+        return shared
+
+    def common(self, kind, users):
+        """Elementos que escuchan todos los usuarios dados"""
+        subset = self.mask(users)
+        if not subset:
+            return []
+        return [item for item, mask in self.masks.get(kind, {}).items() if mask & subset == subset]
+
+    def pair_items(self, kind):
+        """{(usuario1, usuario2): [elementos en común]} en una sola pasada por el índice"""
+        pairs = {}
+        for item, mask in self.masks.get(kind, {}).items():
+            if mask & (mask - 1):   # al menos dos bits
+                for pair in combinations(self.users_in(mask), 2):
+                    pairs.setdefault(pair, []).append(item)
+        return pairs
+
+    def _transpose(self, kind):
+        """Por usuario, un entero con el bit i puesto si escucha el elemento i"""
+        user_items = self._user_items.get(kind)
+        if user_items is None:
+            masks = self.masks.get(kind, {})
+            # bytearray + from_bytes: lineal, sin rehacer enteros enormes por cada bit
+            rows = [bytearray((len(masks) + 7) // 8) for _ in self.users]
+            for ordinal, mask in enumerate(masks.values()):
+                byte, bit = divmod(ordinal, 8)
+                while mask:
+                    low = mask & -mask
+                    rows[low.bit_length() - 1][byte] |= 1 << bit
+                    mask ^= low
+            user_items = self._user_items[kind] = [int.from_bytes(row, 'little') for row in rows]
+        return user_items
+
+    def _items_of(self, kind, user):
+        bit = self.bits.get(user)
+        return self._transpose(kind)[bit] if bit is not None else 0
+
+    def overlap(self, kind, user1, user2):
+        """Número de elementos en común entre dos usuarios"""
+        return (self._items_of(kind, user1) & self._items_of(kind, user2)).bit_count()
+
+    def pair_overlaps(self, kind, users=None):
+        """{(usuario1, usuario2): (en común, en la unión)} para cada par de `users`"""
+        users = list(users) if users is not None else self.users
+        pairs = {}
+        for i, user1 in enumerate(users):
+            items1 = self._items_of(kind, user1)
+            for user2 in users[i + 1:]:
+                items2 = self._items_of(kind, user2)
+                pairs[(user1, user2)] = ((items1 & items2).bit_count(), (items1 | items2).bit_count())
+        return pairs
@@ -0,0 +1,219 @@
+"""
+Archivo columnar de scrobbles para cortar periodos sin consultas.
+
+Se genera a partir de ScrobbleStore y guarda cada columna en un `.npy`
+ordenado por tiempo:
+
+    uts.npy     int64   fecha del scrobble
+    user.npy    int32   ID de usuario
+    track.npy   int32   ID de (canción, artista, álbum)
+    album.npy   int32   ID de (álbum, artista)
+    artist.npy  int32   ID de artista
+
+Los nombres de cada ID están en dims.json. Las columnas se abren con
+mmap: una semana, un mes o un año son un `searchsorted` sobre `uts` y un
+`bincount` sobre el trozo, sin leer el resto del fichero.
+"""
+import json
+import os
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_ARCHIVE_PATH = os.getenv(
+    'RYM_SCROBBLE_ARCHIVE',
+    str(Path(__file__).resolve().parent / 'scrobbles_archive')
+)
+
+COLUMNS = {
+    'uts': np.int64,
+    'user': np.int32,
+    'track': np.int32,
+    'album': np.int32,
+    'artist': np.int32,
+}
+
+
+class ScrobbleArchive:
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        self.path = Path(path)
+        self._load()
+
+    def _load(self):
+        self.columns = {}
+        self.users = []
+        self.artists = []
+        self.albums = []   # [álbum, artist_id]
+        self.tracks = []   # [canción, artist_id, album_id]
+        self.source = None
+        self._songs = None
+        self._song_names = None
+        if not (self.path / 'meta.json').exists():
+            return
+
+        with open(self.path / 'meta.json', 'r', encoding='utf-8') as f:
+            self.source = json.load(f).get('source')
+        with open(self.path / 'dims.json', 'r', encoding='utf-8') as f:
+            dims = json.load(f)
+        self.users = dims['users']
+        self.artists = dims['artists']
+        self.albums = dims['albums']
+        self.tracks = dims['tracks']
+        for name in COLUMNS:
+            self.columns[name] = np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.columns['uts']) if self.columns else 0
+
+    # Construcción
+
+    def refresh(self, store):
+        """Regenera el archivo si el ScrobbleStore tiene filas nuevas; devuelve True si lo hizo"""
+        version = store.version()
+        if self.columns and self.source == version:
+            return False
+        self.build(store.export(), source=version)
+        return True
+
+    def build(self, rows, source=None):
+        """
+        Escribe el archivo a partir de filas (usuario, uts, canción, artista, álbum)
+        ya ordenadas por uts.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        dims = {'users': {}, 'artists': {}, 'albums': {}, 'tracks': {}}
+        data = {name: array('q' if dtype is np.int64 else 'i') for name, dtype in COLUMNS.items()}
+
+        def intern(kind, key):
+            ids = dims[kind]
+            value_id = ids.get(key)
+            if value_id is None:
+                value_id = ids[key] = len(ids)
+            return value_id
+
+        for username, uts, track, artist, album in rows:
+            artist_id = intern('artists', artist)
+            album_id = intern('albums', (album, artist_id))
+            data['uts'].append(uts)
+            data['user'].append(intern('users', username))
+            data['track'].append(intern('tracks', (track, artist_id, album_id)))
+            data['album'].append(album_id)
+            data['artist'].append(artist_id)
+
+        # Columnas y nombres primero, meta.json al final: si algo falla a
+        # medias el archivo anterior sigue marcado como desactualizado
+        (self.path / 'meta.json').unlink(missing_ok=True)
+        for name, dtype in COLUMNS.items():
+            tmp_path = self.path / f'{name}.tmp.npy'
+            np.save(tmp_path, np.frombuffer(data[name], dtype=dtype))
+            os.replace(tmp_path, self.path / f'{name}.npy')
+        self._write_json('dims.json', {kind: list(ids) for kind, ids in dims.items()})
+        self._write_json('meta.json', {'rows': len(data['uts']), 'source': source})
+
+        print(f"🗄️ Archivo columnar regenerado: {len(data['uts'])} scrobbles", file=sys.stderr)
+        self._load()
+
+    def _write_json(self, name, content):
+        tmp_path = self.path / (name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path / name)
+
+    # Consultas
+
+    def period(self, start=None, end=None):
+        """slice de las filas con start <= uts <= end"""
+        uts = self.columns['uts'] if self.columns else np.empty(0, dtype=np.int64)
+        lo = 0 if start is None else int(np.searchsorted(uts, start, side='left'))
+        hi = len(uts) if end is None else int(np.searchsorted(uts, end, side='right'))
+        return slice(lo, hi)
+
+    def _song_of_track(self):
+        """track_id -> song_id, agrupando por (canción, artista) sin mirar el álbum"""
+        if self._songs is None:
+            songs = {}
+            self._songs = np.array(
+                [songs.setdefault((name, artist_id), len(songs)) for name, artist_id, _ in self.tracks],
+                dtype=np.int32
+            )
+            self._song_names = [(name, self.artists[artist_id]) for name, artist_id in songs]
+        return self._songs
+
+    def column(self, kind, rows):
+        """IDs de `kind` ('track', 'album', 'artist', 'song') en las filas dadas"""
+        if kind == 'song':
+            return self._song_of_track()[self.columns['track'][rows]]
+        return self.columns[kind][rows]
+
+    def _size(self, kind):
+        if kind == 'song':
+            self._song_of_track()
+            return len(self._song_names)
+        return len({'track': self.tracks, 'album': self.albums, 'artist': self.artists}[kind])
+
+    def name(self, kind, item_id):
+        """Clave legible con la misma forma que usan los generadores"""
+        if kind == 'track':
+            track, artist_id, album_id = self.tracks[item_id]
+            return track, self.artists[artist_id], self.albums[album_id][0]
+        if kind == 'album':
+            album, artist_id = self.albums[item_id]
+            return album, self.artists[artist_id]
+        if kind == 'song':
+            self._song_of_track()
+            return self._song_names[item_id]
+        return self.artists[item_id]
+
+    def counts(self, kind, start=None, end=None, username=None):
+        """{clave: escuchas} de un periodo, opcionalmente de un solo usuario"""
+        rows = self.period(start, end)
+        ids = self.column(kind, rows)
+        if username is not None:
+            if username not in self.users:
+                return {}
+            ids = ids[self.columns['user'][rows] == self.users.index(username)]
+        plays = np.bincount(ids, minlength=self._size(kind))
+        return {self.name(kind, int(i)): int(plays[i]) for i in np.flatnonzero(plays)}
+
+    def user_counts(self, username, start=None, end=None):
+        """(tracks, albums, artists) de un usuario con la forma de get_tracks_last_week"""
+        tracks = self.counts('track', start, end, username)
+        albums = {}
+        for (album, artist), plays in self.counts('album', start, end, username).items():
+            albums.setdefault(album, {})[artist] = plays
+        artists = self.counts('artist', start, end, username)
+        return tracks, albums, artists
+
+    def user_sets(self, kind, start=None, end=None):
+        """{usuario: array ordenado de IDs distintos} en el periodo"""
+        rows = self.period(start, end)
+        ids = self.column(kind, rows)
+        users = self.columns['user'][rows]
+        return {
+            username: np.unique(ids[users == user_id])
+            for user_id, username in enumerate(self.users)
+            if np.any(users == user_id)
+        }
+
+    def pair_coincidences(self, kind, start=None, end=None):
+        """[(usuario1, usuario2, elementos distintos en común)] con más de cero en común"""
+        sets = sorted(self.user_sets(kind, start, end).items())
+        pairs = []
+        for i, (user1, ids1) in enumerate(sets):
+            for user2, ids2 in sets[i + 1:]:
+                common = len(np.intersect1d(ids1, ids2, assume_unique=True))
+                if common:
+                    pairs.append((user1, user2, common))
+        return sorted(pairs, key=lambda x: x[2], reverse=True)
+
+    def shared_counts(self, kind, start=None, end=None, min_users=2):
+        """[(clave, nº de usuarios)] de los elementos que escuchan al menos min_users usuarios"""
+        rows = self.period(start, end)
+        size = self._size(kind)
+        keys = np.unique(self.columns['user'][rows].astype(np.int64) * size + self.column(kind, rows))
+        users_per_item = np.bincount(keys % size, minlength=size)
+        shared = np.flatnonzero(users_per_item >= min_users)
+        shared = shared[np.argsort(-users_per_item[shared], kind='stable')]
+        return [(self.name(kind, int(i)), int(users_per_item[i])) for i in shared]
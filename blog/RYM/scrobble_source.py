@@ -0,0 +1,131 @@
+"""
+Scrobbles de un periodo para los generadores semanal, mensual y anual.
+
+Reúne lo que antes repetía cada generador: llamadas a Last.fm que
+apuntan en el Roster los perfiles muertos, el filtro de la lista de
+usuarios, y los scrobbles de [start, end] sacados de la API paginando,
+del archivo local (ScrobbleStore) tras sincronizarlo o de su copia
+columnar (ScrobbleArchive).
+"""
+import sys
+
+from recent_tracks import iter_pages, PageFetchError
+from retry_policy import LastFMError
+
+
+class ScrobbleSource:
+    def __init__(self, client, start, end, store=None, archive=None, roster=None,
+                 workers=1, page_workers=1):
+        self.client = client
+        # Periodo del informe, incluidos ambos extremos
+        self.start = start
+        self.end = end
+        # Archivo local de scrobbles (None = paginar la API como antes)
+        self.store = store
+        # Copia columnar del archivo local (necesita store): el periodo se
+        # corta con searchsorted en vez de recorrer filas
+        self.archive = archive if store is not None else None
+        # Estado de cada perfil (privado, no existe...) para no volver a consultarlo
+        self.roster = roster
+        # Perfiles comprobados a la vez por el roster
+        self.workers = max(1, workers)
+        # Páginas de un mismo usuario pedidas en paralelo tras la primera
+        self.page_workers = max(1, page_workers)
+
+    def request(self, method, username, params=None):
+        """JSON de la llamada o None si falla; los transitorios ya se reintentan dentro de call()"""
+        request_params = {
+            'username': username,
+        }
+        if params:
+            request_params.update(params)
+
+        try:
+            print(f"🔍 Consultando datos para {username}...", file=sys.stderr)
+            return self.client.call(method, request_params)
+        except LastFMError as e:
+            print(f"❌ Error consultando datos para {username}: {e}", file=sys.stderr)
+            if self.roster is not None:
+                self.roster.record_error(username, e)
+            return None
+
+    def fetch_info(self, username):
+        return self.client.call('user.getinfo', {'user': username})
+
+    def filter_users(self, usernames):
+        """Quita los perfiles muertos; con archivo local comprueba también el total de escuchas"""
+        if self.roster is None:
+            return usernames
+        fetch_info = self.fetch_info if self.store is not None else None
+        return self.roster.filter(usernames, fetch_info, workers=self.workers)
+
+    def playcount(self, username):
+        return self.roster.playcounts.get(username) if self.roster is not None else None
+
+    def iter_api(self, username):
+        """Genera (canción, artista, álbum) paginando user.getrecenttracks"""
+        def fetch_page(page):
+            print(f"🔍 Debugging {username}: Página {page}", file=sys.stderr)
+            # 'to' fijo: si entra un scrobble nuevo a mitad no se desplazan las páginas
+            params = {
+                'page': page,
+                'limit': 200,
+                'from': self.start,
+                'to': self.end
+            }
+            return self.request('user.getrecenttracks', username, params)
+
+        for data in iter_pages(fetch_page, workers=self.page_workers, max_retries=1):
+            tracks_list = data['recenttracks'].get('track', [])
+            print(f"📊 Tracks in this page: {len(tracks_list)}", file=sys.stderr)
+
+            if not tracks_list:
+                print(f"❌ EMPTY TRACKS LIST for {username}", file=sys.stderr)
+                break
+
+            for track in tracks_list:
+                if track.get('nowplaying', False):
+                    print("⏭️ Skipping now playing track", file=sys.stderr)
+                    continue
+
+                track_name = track.get('name', 'Unknown Track')
+                artist_name = track.get('artist', {}).get('#text', 'Unknown Artist')
+                album_name = track.get('album', {}).get('#text', 'Unknown Album')
+                yield track_name, artist_name, album_name
+
+    def sync(self, username):
+        """Pone al día el archivo local del usuario desde `start`"""
+        self.store.sync(
+            username,
+            lambda params: self.request('user.getrecenttracks', username, params),
+            since=self.start,
+            playcount=self.playcount(username)
+        )
+
+    def iter_store(self, username):
+        """Genera (canción, artista, álbum) desde el archivo local tras sincronizarlo"""
+        self.sync(username)
+        for row in self.store.scrobbles(username, self.start, self.end):
+            yield row['track'], row['artist'], row['album']
+
+    def scrobbles(self, username):
+        """(canción, artista, álbum) del periodo, del archivo local si lo hay o de la API"""
+        if self.store is not None:
+            return self.iter_store(username)
+        return self.iter_api(username)
+
+    def sync_archive(self, usernames):
+        """Pone al día el archivo local de todos los usuarios; devuelve los que se pudieron sincronizar"""
+        synced = []
+        for username in usernames:
+            try:
+                self.sync(username)
+                synced.append(username)
+            except PageFetchError as e:
+                print(f"❌ NO DATA for {username}: {e}", file=sys.stderr)
+        self.archive.refresh(self.store)
+        return synced
+
+    def user_counts(self, username):
+        """(tracks, albums, artists) del periodo desde la copia columnar"""
+        return self.archive.user_counts(username, self.start, self.end)
@@ -0,0 +1,214 @@
+"""
+Archivo local de scrobbles compartido por los generadores semanal,
+mensual, anual e histórico.
+
+Cada scrobble se guarda una sola vez, indexado por usuario y `date.uts`.
+En cada ejecución sólo se piden a Last.fm los scrobbles posteriores al
+último guardado; los informes de cualquier periodo se calculan después
+en local con `scrobbles()`.
+"""
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from recent_tracks import iter_pages
+
+DEFAULT_DB_PATH = os.getenv(
+    'RYM_SCROBBLE_DB',
+    str(Path(__file__).resolve().parent / 'scrobbles.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrobbles (
+    username TEXT NOT NULL,
+    uts INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    track_mbid TEXT,
+    artist_mbid TEXT,
+    album_mbid TEXT,
+    url TEXT,
+    image TEXT,
+    PRIMARY KEY (username, uts, artist, track)
+);
+
+-- Rango de tiempo que ya está descargado sin huecos para cada usuario
+CREATE TABLE IF NOT EXISTS sync_state (
+    username TEXT PRIMARY KEY,
+    synced_from INTEGER NOT NULL,
+    synced_to INTEGER NOT NULL,
+    -- Total de escuchas de user.getinfo en la última sincronización
+    playcount INTEGER
+);
+"""
+
+
+def track_to_row(username, track):
+    """Convierte un track de user.getrecenttracks en fila; None si es 'now playing'"""
+    if track.get('@attr', {}).get('nowplaying') or track.get('nowplaying', False):
+        return None
+    uts = track.get('date', {}).get('uts')
+    if not uts:
+        return None
+
+    artist = track.get('artist', {})
+    album = track.get('album', {})
+    image = next((img['#text'] for img in track.get('image', []) if img.get('#text')), '')
+    return (
+        username,
+        int(uts),
+        track.get('name', 'Unknown Track'),
+        artist.get('#text', 'Unknown Artist'),
+        album.get('#text', 'Unknown Album'),
+        track.get('mbid', ''),
+        artist.get('mbid', ''),
+        album.get('mbid', ''),
+        track.get('url', ''),
+        image,
+    )
+
+
+class ScrobbleStore:
+    def __init__(self, db_path=DEFAULT_DB_PATH, page_workers=4):
+        self.db_path = db_path
+        self.page_workers = page_workers
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(sync_state)")}
+            if 'playcount' not in columns:
+                conn.execute("ALTER TABLE sync_state ADD COLUMN playcount INTEGER")
+
+    @contextmanager
+    def _connect(self):
+        # Una conexión por operación: los generadores consultan usuarios en hilos
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def sync_state(self, username):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT synced_from, synced_to FROM sync_state WHERE username = ?",
+                (username,)
+            ).fetchone()
+        return (row['synced_from'], row['synced_to']) if row else None
+
+    def synced_playcount(self, username):
+        """Total de escuchas guardado en la última sincronización (None si no se conoce)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT playcount FROM sync_state WHERE username = ?", (username,)
+            ).fetchone()
+        return row['playcount'] if row else None
+
+    def last_timestamp(self, username):
+        """Último `date.uts` guardado para el usuario (None si no hay ninguno)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(uts) FROM scrobbles WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0]
+
+    def _download(self, username, request, start, end):
+        """Descarga [start, end] y lo guarda en una sola transacción"""
+        def fetch_page(page):
+            return request({'page': page, 'limit': 200, 'from': start, 'to': end})
+
+        rows = []
+        for data in iter_pages(fetch_page, workers=self.page_workers):
+            for track in data['recenttracks'].get('track', []):
+                row = track_to_row(username, track)
+                if row:
+                    rows.append(row)
+
+        # Las páginas llegan de más nuevo a más viejo: si algo falla antes de
+        # este punto no se guarda nada y no quedan huecos en el archivo
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO scrobbles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def sync(self, username, request, since=0, playcount=None):
+        """
+        Pone al día el archivo de un usuario.
+
+        request(params) debe hacer la llamada user.getrecenttracks de ese
+        usuario con los params dados y devolver el JSON (o None si falla).
+        `since` es el inicio más antiguo que necesita el informe: si el
+        archivo aún no lo cubre se descarga también ese tramo.
+        `playcount` es el total de escuchas de user.getinfo: si coincide con
+        el de la última sincronización no hay scrobbles nuevos y no se pide
+        nada (siempre que el archivo ya cubra `since`).
+        Lanza recent_tracks.PageFetchError si Last.fm no responde.
+        """
+        now = int(time.time())
+        state = self.sync_state(username)
+        downloaded = 0
+
+        if (playcount is not None and state is not None and since >= state[0]
+                and self.synced_playcount(username) == playcount):
+            print(f"💤 {username}: sin scrobbles nuevos desde la última sincronización", file=sys.stderr)
+            return 0
+
+        if state is None:
+            synced_from = since
+            downloaded += self._download(username, request, since, now)
+        else:
+            synced_from, synced_to = state
+            if since < synced_from:
+                downloaded += self._download(username, request, since, synced_from)
+                synced_from = since
+            # Desde el último scrobble guardado (incluido) para no perder los
+            # que se enviaron con retraso; los repetidos se ignoran
+            last = self.last_timestamp(username)
+            start = max(last if last is not None else synced_from, synced_from)
+            downloaded += self._download(username, request, start, now)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (username, synced_from, synced_to, playcount) "
+                "VALUES (?, ?, ?, ?)",
+                (username, synced_from, now, playcount)
+            )
+        print(f"💾 {username}: {downloaded} scrobbles descargados", file=sys.stderr)
+        return downloaded
+
+    def scrobbles(self, username, start=None, end=None):
+        """Scrobbles del usuario entre start y end (incluidos), del más nuevo al más antiguo como la API"""
+        query = "SELECT * FROM scrobbles WHERE username = ?"
+        params = [username]
+        if start is not None:
+            query += " AND uts >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND uts <= ?"
+            params.append(end)
+        query += " ORDER BY uts DESC"
+
+        # Generador: las filas se leen según se consumen, sin cargar el periodo entero
+        with self._connect() as conn:
+            yield from conn.execute(query, params)
+
+    def version(self):
+        """Cambia cada vez que se añaden scrobbles; sirve para invalidar copias derivadas"""
+        with self._connect() as conn:
+            count, last_rowid = conn.execute("SELECT COUNT(*), MAX(rowid) FROM scrobbles").fetchone()
+        return [count, last_rowid]
+
+    def export(self):
+        """(usuario, uts, canción, artista, álbum) de todos los usuarios, del más antiguo al más nuevo"""
+        with self._connect() as conn:
+            yield from conn.execute(
+                "SELECT username, uts, track, artist, album FROM scrobbles ORDER BY uts, rowid"
+            )
@@ -0,0 +1,112 @@
+"""
+Renderizado de los posts de estadísticas (semanal, mensual, anual, histórico).
+
+Las funciones escriben en cualquier objeto con `write()` (un fichero o
+un io.StringIO), fila a fila y sin concatenar cadenas. `atomic_open`
+escribe el post en un temporal y lo renombra al final, así Hugo nunca ve
+un fichero a medias.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from topk import top_k
+
+
+def _file_mode(path):
+    """Permisos del fichero existente o, si no existe, los que le daría open() con el umask actual"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_open(path):
+    """Fichero de texto que sustituye a `path` sólo si todo se escribe bien"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+        # mkstemp crea el temporal con 0600; el post tiene que seguir siendo legible
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_table(out, headers, rows):
+    """Tabla markdown; rows es cualquier iterable de secuencias"""
+    out.write('| ' + ' | '.join(headers) + ' |\n')
+    out.write('|' + '|'.join('-' * (len(h) + 2) for h in headers) + '|\n')
+    out.writelines('| ' + ' | '.join(map(str, row)) + ' |\n' for row in rows)
+
+
+def format_user_plays(users):
+    """{usuario: escuchas} -> 'usuario (n), otro (m)'"""
+    return ', '.join(f"{user} ({plays})" for user, plays in users.items())
+
+
+def top_items(data, n=10):
+    """
+    Los n elementos con más escuchas de {elemento: escuchas}, por heap sin
+    ordenar todo. Los empates se deshacen por nombre, no por el orden del
+    dict, para que el archivo columnar y la API den el mismo top.
+    """
+    return top_k(data, n, tie_break=str)
+
+
+def write_coincidences(out, index):
+    """Tablas de canciones, álbumes y artistas compartidos de un CoincidenceIndex"""
+    out.write("## Coincidencias entre Usuarios\n\n")
+
+    out.write("### Canciones\n")
+    write_table(out, ("Canción", "Artista", "Álbum", "Usuarios"), (
+        (track, artist, album, format_user_plays(users))
+        for (track, artist, album), users in index.shared_tracks()
+    ))
+
+    out.write("\n### Álbumes\n")
+    write_table(out, ("Álbum", "Artista", "Usuarios"), (
+        (album, artist, format_user_plays(users))
+        for album, artist, users in index.shared_albums()
+    ))
+
+    out.write("\n### Artistas\n")
+    write_table(out, ("Artista", "Usuarios"), (
+        (artist, format_user_plays(users))
+        for artist, users in index.shared_artists()
+    ))
+
+
+def write_user_tops(out, users_data, n=10):
+    """Secciones 'Top 10 para {usuario}' con artistas y canciones"""
+    for user, data in users_data.items():
+        out.write(f"## Top {n} para {user}\n\n")
+
+        out.write("*Top Artistas*\n")
+        write_table(out, ("Artista", "Reproducciones"), top_items(data['artists'], n))
+        out.write("\n")
+
+        out.write("*Top Canciones*\n")
+        write_table(out, ("Canción", "Artista", "Álbum", "Reproducciones"), (
+            (track, artist, album, plays)
+            for (track, artist, album), plays in top_items(data['tracks'], n)
+        ))
+        out.write("\n")
+
+
+def write_plays_matrix(out, title, index, usernames):
+    """Canciones compartidas con una columna de escuchas por usuario"""
+    shared = index.shared_tracks()
+    if not shared:
+        return
+    out.write(f"### {title}\n")
+    write_table(out, ("Canción", "Artista", "Álbum", *usernames), (
+        (track, artist, album, *(users.get(user, 0) for user in usernames))
+        for (track, artist, album), users in shared
+    ))
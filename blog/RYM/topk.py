@@ -0,0 +1,82 @@
+"""
+Top-k de contadores sin ordenar el diccionario entero.
+
+- top_k(): exacto, con selección por heap (O(n log k)). Mismo resultado
+  y mismo orden en los empates que sorted(..., reverse=True)[:k], o
+  empates por nombre con tie_break.
+- SpaceSaving: aproximado y en streaming, con memoria fija de `capacity`
+  contadores. Cualquier elemento con más de total/capacity escuchas está
+  seguro en el resultado; el conteo de cada uno puede pasarse como mucho
+  en su `error`.
+"""
+import heapq
+from operator import itemgetter
+
+
+def top_k(counts, k, key=itemgetter(1), tie_break=None):
+    """
+    Los k pares (elemento, valor) de `counts` (dict o iterable de pares) con
+    mayor key. Con tie_break, los empates van de menor a mayor
+    tie_break(elemento) en vez de en el orden en que aparecen.
+    """
+    items = counts.items() if hasattr(counts, 'items') else counts
+    if tie_break is not None:
+        order = lambda pair: (-key(pair), tie_break(pair[0]))
+        if k is None:
+            return sorted(items, key=order)
+        return heapq.nsmallest(k, items, key=order)
+    if k is None:
+        return sorted(items, key=key, reverse=True)
+    return heapq.nlargest(k, items, key=key)
+
+
+class SpaceSaving:
+    """Algoritmo Space-Saving (Metwally et al.) para los elementos más frecuentes de un stream"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}    # elemento -> conteo estimado
+        self.errors = {}    # elemento -> sobreestimación máxima
+        self.total = 0
+        # Heap de (conteo, orden, elemento) para encontrar el mínimo; las
+        # entradas viejas se descartan al sacarlas
+        self._heap = []
+        self._seq = 0
+
+    def _push(self, item):
+        self._seq += 1
+        heapq.heappush(self._heap, (self.counts[item], self._seq, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, seq, item) for count, seq, item in self._heap
+                          if self.counts.get(item) == count]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            # Lleno: el nuevo hereda el contador del mínimo, que sale
+            victim = self._pop_min()
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+        self._push(item)
+
+    def consume(self, items):
+        for item in items:
+            self.add(item)
+        return self
+
+    def top(self, k=None):
+        """[(elemento, conteo estimado, error)] de mayor a menor"""
+        return [(item, count, self.errors[item]) for item, count in top_k(self.counts, k)]
@@ -0,0 +1,92 @@
+"""
+Dataset legible por máquina con las escuchas semanales por usuario.
+
+blog_rym.py lo escribe junto al markdown y los scripts de graficos/ lo
+leen directamente, sin tener que volver a parsear las tablas (que se
+rompen si un nombre lleva `|`).
+
+Formato JSON Lines, una fila por (usuario, elemento):
+
+    {"user": ..., "kind": "track", "track": ..., "artist": ..., "album": ..., "plays": n}
+    {"user": ..., "kind": "album", "album": ..., "artist": ..., "plays": n}
+    {"user": ..., "kind": "artist", "artist": ..., "plays": n}
+
+Si la ruta termina en .parquet se guarda la misma tabla en Parquet
+(necesita pandas y pyarrow).
+"""
+import json
+import os
+from pathlib import Path
+
+from scrobble_aggregator import CoincidenceIndex
+
+
+def iter_records(users_data):
+    """Filas del dataset a partir de {usuario: {'tracks', 'albums', 'artists'}}"""
+    for user, data in users_data.items():
+        for (track, artist, album), plays in data['tracks'].items():
+            yield {'user': user, 'kind': 'track', 'track': track,
+                   'artist': artist, 'album': album, 'plays': plays}
+        for album, album_artists in data['albums'].items():
+            for artist, plays in album_artists.items():
+                yield {'user': user, 'kind': 'album', 'album': album,
+                       'artist': artist, 'plays': plays}
+        for artist, plays in data['artists'].items():
+            yield {'user': user, 'kind': 'artist', 'artist': artist, 'plays': plays}
+
+
+def write_dataset(path, users_data):
+    """Escribe el dataset de forma atómica (fichero temporal + rename)"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    if path.suffix == '.parquet':
+        import pandas as pd
+        pd.DataFrame(list(iter_records(users_data))).to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in iter_records(users_data):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write('\n')
+
+    os.replace(tmp_path, path)
+
+
+def read_records(path):
+    path = Path(path)
+    if path.suffix == '.parquet':
+        import pandas as pd
+        yield from pd.read_parquet(path).to_dict('records')
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_dataset(path):
+    """{usuario: {'tracks', 'albums', 'artists'}} con la misma forma que usa blog_rym.py"""
+    users_data = {}
+    for record in read_records(path):
+        data = users_data.setdefault(record['user'], {'tracks': {}, 'albums': {}, 'artists': {}})
+        plays = int(record['plays'])
+        if record['kind'] == 'track':
+            data['tracks'][(record['track'], record['artist'], record['album'])] = plays
+        elif record['kind'] == 'album':
+            data['albums'].setdefault(record['album'], {})[record['artist']] = plays
+        elif record['kind'] == 'artist':
+            data['artists'][record['artist']] = plays
+    return users_data
+
+
+def load_index(path):
+    """CoincidenceIndex con todos los usuarios del dataset"""
+    index = CoincidenceIndex()
+    for user, data in load_dataset(path).items():
+        index.add_user(user, data['tracks'], data['albums'], data['artists'])
+    return index
+
+
+def is_dataset(path):
+    return Path(path).suffix in ('.jsonl', '.parquet')
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 import requests
 import json
+import sys
 from datetime import datetime, timedelta
+from pathlib import Path
 from dotenv import load_dotenv
 import os
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'RYM'))
+from lastfm_client import LastFMClient
+
 load_dotenv()
 
 class LastFMWeeklyListenings:
@@ -17,7 +22,7 @@ class LastFMWeeklyListenings:
         """
         self.username = username
         self.api_key = api_key
-        self.base_url = "http://ws.audioscrobbler.com/2.0/"
+        self.client = LastFMClient(api_key)
     
     def get_weekly_albums(self, limit=10):
         """
@@ -28,17 +33,14 @@ class LastFMWeeklyListenings:
         """
         # Parámetros para la solicitud de API
         params = {
-            'method': 'user.gettopalbums',
             'user': self.username,
-            'api_key': self.api_key,
             'period': '7day',  # Últimos 7 días
-            'format': 'json',
             'limit': limit
         }
         
         try:
             # Realizar solicitud a Last.fm
-            response = requests.get(self.base_url, params=params)
+            response = self.client.request('user.gettopalbums', params)
             response.raise_for_status()
             
             # Procesar respuesta
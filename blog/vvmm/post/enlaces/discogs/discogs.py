@@ -15,6 +15,11 @@ import sys
 import subprocess
 from dotenv import load_dotenv
 import os
+from pathlib import Path
+
+# Presupuesto de peticiones compartido con el resto de scripts (ver blog/RYM/rate_limiter.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'RYM'))
+from rate_limiter import get_limiter
 
 
 # Cargar las variables de entorno desde el archivo .env
@@ -34,6 +39,7 @@ def get_master_release_id(artist_name, album_name):
 
     try:
         # Realiza la solicitud GET a la API de Discogs
+        get_limiter('discogs').wait()
         response = requests.get(search_url)
         response.raise_for_status()  # Lanza una excepción si hay un error en la solicitud
 
@@ -58,6 +64,7 @@ def get_master_release_id(artist_name, album_name):
 def get_artist_id(artist_name):
     search_url = f"{BASE_URL}/database/search?q={artist_name}&type=artist&token={TOKEN}"
     try:
+        get_limiter('discogs').wait()
         response = requests.get(search_url)
         response.raise_for_status()
         data = response.json()
@@ -79,6 +86,7 @@ def save_artist_releases(artist_name, output_path):
     while True:
         releases_url = f"{BASE_URL}/artists/{artist_id}/releases?token={TOKEN}&page={page}&per_page=100"
         try:
+            get_limiter('discogs').wait()
             response = requests.get(releases_url)
             response.raise_for_status()
             data = response.json()
@@ -13,12 +13,18 @@
 import json
 import requests
 import sys
+from pathlib import Path
+
+# Presupuesto de peticiones compartido con el resto de scripts (ver blog/RYM/rate_limiter.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'RYM'))
+from rate_limiter import get_limiter
 
 def obtener_datos_master_discogs(master_id):
     # URL de la API de Discogs para obtener información de un master por su ID
     url = f'https://api.discogs.com/masters/{master_id}'
     
     # Realizar la solicitud GET a la API de Discogs
+    get_limiter('discogs').wait()
     response = requests.get(url)
     
     # Verificar si la solicitud fue exitosa (código de estado 200)
@@ -18,6 +18,11 @@ import requests
 import sys
 from dotenv import load_dotenv
 import os
+from pathlib import Path
+
+# Presupuesto de peticiones compartido con el resto de scripts (ver blog/RYM/rate_limiter.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'RYM'))
+from rate_limiter import get_limiter
 
 # Acceder a las variables de entorno
 release_id = sys.argv[1]
@@ -34,6 +39,7 @@ def get_artist_url(artist_id):
 
 def get_artist_profile(artist_id):
     artist_url = f'https://api.discogs.com/artists/{artist_id}'
+    get_limiter('discogs').wait()
     response = requests.get(artist_url)
     data = response.json()
     return data.get('profile', 'Perfil no disponible')
@@ -55,6 +61,7 @@ def get_album_info(release_id):
     album_url = f'https://api.discogs.com/releases/{release_id}'
     
     # Realiza la solicitud para obtener la información del release
+    get_limiter('discogs').wait()
     response = requests.get(album_url)
     data = response.json()
     
@@ -16,6 +16,11 @@ import json
 import requests
 import sys
 import os 
+from pathlib import Path
+
+# Presupuesto de peticiones compartido con el resto de scripts (ver blog/RYM/rate_limiter.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'RYM'))
+from rate_limiter import get_limiter
 
 home_dir = os.environ["HOME"]
 file_info = os.path.join(home_dir, "Scripts", "hugo_scripts", "blog", "vvmm", "post", "discogs_info_extra.txt")
@@ -27,6 +32,7 @@ def obtener_datos_release_discogs(release_id):
     url = f'https://api.discogs.com/releases/{release_id}'
     
     # Realizar la solicitud GET a la API de Discogs
+    get_limiter('discogs').wait()
     response = requests.get(url)
     
     # Verificar si la solicitud fue exitosa (código de estado 200)
@@ -12,6 +12,11 @@
 
 import requests
 import sys
+from pathlib import Path
+
+# Presupuesto de peticiones compartido con el resto de scripts (ver blog/RYM/rate_limiter.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / 'RYM'))
+from rate_limiter import get_limiter
 
 def buscar_album(artist, album):
     # URL base de la API de MusicBrainz
@@ -22,6 +27,7 @@ def buscar_album(artist, album):
         "fmt": "json"
     }
     # Realizar la solicitud GET a la API
+    get_limiter('musicbrainz').wait()
     response = requests.get(base_url + "release/", params=params)
     # Verificar si la solicitud fue exitosa
     if response.status_code == 200: